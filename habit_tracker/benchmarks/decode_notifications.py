@@ -0,0 +1,65 @@
+"""
+Per-call CPU of decoding a get_notifications_for_period response.
+
+Run from the habit_tracker directory:
+    python -m benchmarks.decode_notifications [rows]
+"""
+import json
+import os
+import sys
+import timeit
+
+os.environ.setdefault('API_ENDPOINT_PORT', '39999')
+
+from pydantic import BaseModel
+
+from data.schemas import Notification
+from data.services.backend_service.backend_service import NOTIFICATION_LIST_ADAPTER
+
+
+class LegacyResponse(BaseModel):
+    status_code: int
+    body: dict | list | None = None
+
+
+def make_payload(rows: int) -> bytes:
+    return json.dumps([
+        {
+            'notification_id': i,
+            'habit_id': i // 3,
+            'user_id': i // 7,
+            'time_in_seconds': (i * 37) % 86400,
+            'habit_name': f'habit {i // 3}',
+        }
+        for i in range(rows)
+    ]).encode()
+
+
+def legacy_decode(raw: bytes) -> list[Notification]:
+    # json.loads stands in for aiohttp's response.json()
+    r = LegacyResponse(status_code=200, body=json.loads(raw))
+    return [Notification(**h) for h in r.body]
+
+
+def adapter_decode(raw: bytes) -> list[Notification]:
+    return NOTIFICATION_LIST_ADAPTER.validate_json(raw)
+
+
+def main(rows: int = 10_000, repeat: int = 5, number: int = 3) -> None:
+    raw = make_payload(rows)
+    assert legacy_decode(raw) == adapter_decode(raw)
+
+    print(f'get_notifications_for_period decode, {rows} rows, {len(raw) / 1024:.0f} KiB')
+    results = {}
+    for name, fn in (('legacy (json + Response + per-row model)', legacy_decode),
+                     ('TypeAdapter.validate_json', adapter_decode)):
+        best = min(timeit.repeat(lambda: fn(raw), repeat=repeat, number=number)) / number
+        results[name] = best
+        print(f'  {name:<45} {best * 1000:8.2f} ms/call')
+
+    legacy, fast = results.values()
+    print(f'  saved {(legacy - fast) * 1000:.2f} ms/call ({legacy / fast:.1f}x)')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
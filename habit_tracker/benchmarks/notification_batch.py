@@ -0,0 +1,88 @@
+"""
+Ingesting a get_notifications_for_period response: a pydantic Notification per row
+with tuple keys in a set (previous Notificator) vs NotificationBatch columns.
+
+Run from the habit_tracker directory:
+    python -m benchmarks.notification_batch [rows ...]
+"""
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+os.environ.setdefault('API_ENDPOINT_PORT', '39999')
+
+from data.schemas.notification_batch import NotificationBatch
+from data.services.backend_service.backend_service import NOTIFICATION_LIST_ADAPTER
+
+# Share of rows repeated by the backend and rows without a user
+DUPLICATES = 0.02
+UNROUTABLE = 0.01
+
+
+def make_response(rows: int) -> bytes:
+    rng = random.Random(0)
+    items = []
+    for i in range(rows):
+        items.append({
+            'notification_id': i,
+            'habit_id': i // 2,
+            'user_id': None if rng.random() < UNROUTABLE else i // 4,
+            'habit_name': None,
+            'time_in_seconds': rng.randrange(8 * 3600, 9 * 3600),
+        })
+    items += rng.sample(items, int(rows * DUPLICATES))
+    return json.dumps(items).encode()
+
+
+def legacy(content: bytes, start: float) -> int:
+    seen = set()
+    by_user = {}
+    for n in NOTIFICATION_LIST_ADAPTER.validate_json(content):
+        if n.user_id is None or n.time_in_seconds is None:
+            continue
+        key = (int(n.user_id), int(n.habit_id), n.notification_id if n.notification_id is not None else -1,
+               int(n.time_in_seconds))
+        if key in seen:
+            continue
+        seen.add(key)
+        by_user.setdefault(n.user_id, []).append(n)
+    return len(seen)
+
+
+def columnar(content: bytes, start: float) -> int:
+    batch = NotificationBatch.from_json(content)
+    batch = batch.take(batch.routable())
+    batch = batch.take(batch.unique_rows())
+    batch.fire_times(start)
+    batch.habits_missing_names()
+    users = len(np.unique(batch.user_id))
+    return len(batch) if users else 0
+
+
+def measure(fn, *args, repeat: int = 5) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main(sizes: list[int]) -> None:
+    start = time.time()
+    for rows in sizes:
+        content = make_response(rows)
+        assert legacy(content, start) == columnar(content, start)
+        legacy_seconds = measure(legacy, content, start)
+        columnar_seconds = measure(columnar, content, start)
+        print(f'{rows} rows ({len(content) / 1024 / 1024:.1f} MiB)')
+        print(f'  pydantic rows + tuple set   {legacy_seconds * 1000:8.1f} ms')
+        print(f'  NotificationBatch columns   {columnar_seconds * 1000:8.1f} ms  ({legacy_seconds / columnar_seconds:.1f}x)')
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or [10_000, 100_000])
@@ -0,0 +1,59 @@
+"""
+Local reminder times: a ZoneInfo and datetime.now() per notification (previous
+NotificationBase.time) vs the precomputed offset tables of core.timezone_utils.
+
+Run from the habit_tracker directory:
+    python -m benchmarks.timezone_offsets [notifications]
+"""
+import datetime
+import os
+import random
+import sys
+import time
+from zoneinfo import ZoneInfo
+
+os.environ.setdefault('API_ENDPOINT_PORT', '39999')
+
+from core.timezone_utils import timezones
+from core.utils import seconds_to_time
+
+ZONES = ('Europe/Moscow', 'Europe/Berlin', 'America/New_York', 'Asia/Tokyo', 'Australia/Sydney', 'UTC')
+# Reminders on one screen of todays_notifications
+KEYBOARD_SIZE = 20
+
+
+def legacy_time(time_in_seconds: int, tz: str) -> datetime.time:
+    offset = datetime.datetime.now(ZoneInfo(tz)).utcoffset()
+    # wrapped here only so the legacy path does not raise past midnight
+    return seconds_to_time(time_in_seconds + int(offset.total_seconds()))
+
+
+def measure(fn, repeat: int = 5) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main(notifications: int = 100_000) -> None:
+    rng = random.Random(0)
+    rows = [(rng.randrange(24 * 60 * 60), rng.choice(ZONES)) for _ in range(notifications)]
+    keyboard = [s for s, _ in rows[:KEYBOARD_SIZE]]
+
+    print(f'{notifications} reminders over {len(ZONES)} zones')
+    legacy = measure(lambda: [legacy_time(s, tz) for s, tz in rows])
+    tables = measure(lambda: [timezones.local_time(tz, s) for s, tz in rows])
+    print(f'  per reminder, ZoneInfo + now()      {legacy / notifications * 1e6:8.2f} us')
+    print(f'  per reminder, offset tables         {tables / notifications * 1e6:8.2f} us  ({legacy / tables:.1f}x)')
+
+    rounds = max(notifications // KEYBOARD_SIZE, 1)
+    legacy = measure(lambda: [[legacy_time(s, 'Europe/Berlin') for s in keyboard] for _ in range(rounds)])
+    batch = measure(lambda: [timezones.local_times('Europe/Berlin', keyboard) for _ in range(rounds)])
+    print(f'  keyboard of {KEYBOARD_SIZE}, ZoneInfo + now()     {legacy / rounds * 1e6:8.2f} us')
+    print(f'  keyboard of {KEYBOARD_SIZE}, batch conversion     {batch / rounds * 1e6:8.2f} us  ({legacy / batch:.1f}x)')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
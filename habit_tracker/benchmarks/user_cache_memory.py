@@ -0,0 +1,114 @@
+"""
+Bytes per cached user: the previous dict-backed layout vs the slotted one.
+
+Run from the habit_tracker directory:
+    python -m benchmarks.user_cache_memory [users]
+"""
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+
+os.environ.setdefault('API_ENDPOINT_PORT', '39999')
+
+from bot import state_machine  # noqa: F401  registers the states
+from bot.cache import UserCache
+from bot.messenger import Lane, Messenger
+from bot.state_machine.state_machine import StateMachine
+from bot.state_machine.states_factory import STATES_FACTORY
+from bot.states import HabitStates
+from data.factory import setup_backend_repository, close_backend_repository
+from data.schemas.user import LanguageEnum
+
+
+TRACKED_MESSAGES = 4
+
+
+@dataclass
+class LegacyUserCache:
+    telegram_id: int
+    language: LanguageEnum | None = None
+    timezone: str | None = None
+    backend_id: int | None = None
+    state_machine: StateMachine | None = None
+    last_datetime: datetime | None = None
+    messenger: 'LegacyMessenger | None' = None
+    is_inited: bool = False
+
+
+class LegacyMessenger:
+    def __init__(self, telegram_id: int) -> None:
+        self.__telegram_id = telegram_id
+        self.__main_message_id = None
+        self.__main_text_hash = 0
+        self.__main_markup_hash = 0
+        self.__recv_messages_ids = []
+        self.__sent_messages_ids = []
+        self.__lanes = {lane: deque() for lane in Lane}
+        self.__pending_main_update = None
+        self.__on_ready = None
+        self.__last_enqueued_at = time.monotonic()
+
+    def track(self, message_id: int) -> None:
+        self.__sent_messages_ids.append(message_id)
+
+
+def make_legacy(telegram_id: int) -> LegacyUserCache:
+    user_cache = LegacyUserCache(telegram_id=telegram_id, last_datetime=datetime.now(), backend_id=telegram_id,
+                                 language=LanguageEnum.en, timezone='Europe/Moscow')
+    user_cache.state_machine = StateMachine(HabitStates.init, user_cache, STATES_FACTORY)
+    user_cache.messenger = LegacyMessenger(telegram_id)
+    for i in range(TRACKED_MESSAGES):
+        user_cache.messenger.track(1_000_000 + i)
+    return user_cache
+
+
+def make_slotted(telegram_id: int) -> UserCache:
+    user_cache = UserCache(telegram_id=telegram_id, last_datetime=datetime.now(), backend_id=telegram_id,
+                           language=LanguageEnum.en, timezone='Europe/Moscow')
+    user_cache.messenger = Messenger(telegram_id)
+    for i in range(TRACKED_MESSAGES):
+        user_cache.messenger.register_recv_message(1_000_000 + i)
+    return user_cache
+
+
+def make_slotted_interacted(telegram_id: int) -> UserCache:
+    user_cache = make_slotted(telegram_id)
+    _ = user_cache.state_machine
+    return user_cache
+
+
+def bytes_per_user(factory, users: int) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    entries = [factory(i) for i in range(users)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del entries
+    return (after - before) / users
+
+
+async def main(users: int = 20_000) -> None:
+    # StateMachine resolves the repository on construction
+    await setup_backend_repository()
+    try:
+        print(f'bytes per cached user, {users} users, {TRACKED_MESSAGES} tracked message ids each')
+        results = {}
+        for name, factory in (('legacy (dataclass, eager StateMachine, lists)', make_legacy),
+                              ('slotted, StateMachine not built', make_slotted),
+                              ('slotted, after first interaction', make_slotted_interacted)):
+            results[name] = bytes_per_user(factory, users)
+            print(f'  {name:<48} {results[name]:8.0f} B/user')
+
+        legacy, slotted, _ = results.values()
+        print(f'  notification-only users: {legacy / slotted:.1f}x smaller')
+    finally:
+        await close_backend_repository()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000))
@@ -13,12 +13,15 @@ from core.bot_mode import BotMode
 from .handlers import router
 from . import state_machine  # state-machine initialization
 from . import middlewares
+from .rate_limiter import RateLimiter, RateLimitMiddleware
 import bot as bot_module
 
 
 logger = logging.getLogger(__name__)
 
 bot = Bot(token=config.BOT_TOKEN)
+# Every outbound call (messenger queue, callback answers, web endpoint) goes through the limiter
+bot.session.middleware(RateLimitMiddleware(RateLimiter()))
 bot_module.bot_instance = bot
 dp = Dispatcher()
 
@@ -62,6 +65,9 @@ async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
 async def run_bot():
     dp.include_router(router)
 
+    # Outer update middleware: runs before filters and the per-event middlewares below
+    dp.update.outer_middleware(middlewares.MailboxMiddleware(config.BOT_MAX_CONCURRENT_UPDATES))
+
     for middleware in middlewares.m:
         dp.message.middleware(middleware)
         dp.callback_query.middleware(middleware)
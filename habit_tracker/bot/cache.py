@@ -1,14 +1,21 @@
 from __future__ import annotations
 
+import asyncio
 import logging
-from dataclasses import dataclass
-from datetime import datetime
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
 
+import config
+from bot import snapshot
+from bot.snapshot import SnapshotError, UserSnapshot
 from bot.states import HabitStates
 from bot.state_machine.state_machine import StateMachine
 from bot.state_machine.states_factory import STATES_FACTORY
 from data.factory import get_backend_repository
-from data.schemas.user import LanguageEnum
+from data.schemas.user import LanguageEnum, User
+from core.metrics import metrics
+from core.single_flight import SingleFlight
 from .messenger import Messenger
 
 from typing import TYPE_CHECKING
@@ -20,32 +27,104 @@ if TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+@dataclass(slots=True)
 class UserCache:
     telegram_id: int
     language: LanguageEnum | None = None
     timezone: str | None = None
     backend_id: int | None = None
-    state_machine: StateMachine | None = None
     last_datetime: datetime | None = None
     messenger: Messenger | None = None
     is_inited: bool = False
+    # Built on first access: users that only receive notifications never need one
+    _state_machine: StateMachine | None = field(default=None, init=False, repr=False)
+    _initial_state: HabitStates = field(default=HabitStates.init, init=False, repr=False)
+
+    @property
+    def state_machine(self) -> StateMachine:
+        if self._state_machine is None:
+            self._state_machine = StateMachine(self._initial_state, self, STATES_FACTORY)
+        return self._state_machine
+
+    @property
+    def state(self) -> HabitStates:
+        """Current state kind, without building the state machine."""
+        return self._state_machine.state if self._state_machine is not None else self._initial_state
+
+    def restore_state(self, state: HabitStates) -> None:
+        """Screen a restored session starts on, used until the state machine is built."""
+        if self._state_machine is None:
+            self._initial_state = state
 
     def is_registered(self) -> bool:
         return self.backend_id is not None
 
+    def is_switchable(self) -> bool:
+        return self._state_machine is None or self._state_machine.is_switchable()
+
 
 class Cache:
-    def __init__(self, messenger_queue: MessengerQueue):
-        self.__users_cache: dict[int, UserCache] = {}
+    # Rough footprint of a user entry: UserCache, Messenger and a StateMachine whose state may hold
+    # a habit list (~0.8 KiB without habits, see benchmarks.user_cache_memory)
+    ENTRY_BASE_BYTES = 2 * 1024
+    MESSAGE_ID_BYTES = 8
+    # A UserSnapshot with its dict slot, ~0.4 KiB measured
+    SNAPSHOT_ENTRY_BYTES = 512
+    # Screens that handle input without on_enter having run, safe to resume after a restart
+    RESTORABLE_STATES = (
+        HabitStates.todays_notifications,
+        HabitStates.settings,
+        HabitStates.help_command,
+        HabitStates.progress,
+    )
+    # Older sessions are not worth keeping: the bot can no longer delete their messages
+    SNAPSHOT_MAX_AGE = timedelta(days=2)
+
+    def __init__(self,
+                 messenger_queue: MessengerQueue,
+                 idle_ttl_seconds: float = config.USER_CACHE_IDLE_TTL_SECONDS,
+                 max_entries: int = config.USER_CACHE_MAX_ENTRIES,
+                 memory_budget_bytes: float = config.USER_CACHE_MEMORY_BUDGET_MB * 1024 * 1024,
+                 snapshot_path: str | None = config.USER_SNAPSHOT_PATH,
+                 snapshot_max_entries: int = config.USER_SNAPSHOT_MAX_ENTRIES,
+                 ):
+        # Least recently used first
+        self.__users_cache: OrderedDict[int, UserCache] = OrderedDict()
         self.__messenger_queue = messenger_queue
+        self.__repository = get_backend_repository()
+        self.__init_flight = SingleFlight('user_init')
+        self.__idle_ttl = timedelta(seconds=idle_ttl_seconds)
+        self.__max_entries = max_entries
+        self.__memory_budget_bytes = memory_budget_bytes
+        self.__estimated_bytes = 0
+        self.__should_stop = False
+        # Sessions from the snapshot or evicted users, turned back into entries on first use.
+        # Least recently seen first, bounded by count and SNAPSHOT_MAX_AGE whether or not they are saved.
+        self.__snapshots: dict[int, UserSnapshot] = {}
+        self.__snapshot_path = snapshot_path or None
+        self.__snapshot_max_entries = snapshot_max_entries
+
+        metrics.gauge('user_cache_entries', 'Users held in memory', callback=lambda: len(self.__users_cache))
+        metrics.gauge('user_cache_estimated_bytes',
+                      'Estimated memory held by user entries and saved sessions, as of the last eviction pass',
+                      callback=lambda: self.__estimated_bytes)
+        self.__evictions = metrics.counter('user_cache_evictions_total', 'User entries dropped from memory')
+        metrics.gauge('user_cache_snapshots', 'Saved sessions waiting to be restored',
+                      callback=lambda: len(self.__snapshots))
+        self.__restored = metrics.counter('user_cache_restored_total', 'User entries restored from a saved session')
+        self.__snapshots_dropped = metrics.counter('user_cache_snapshots_dropped_total',
+                                                   'Saved sessions dropped to stay within the entry or memory budget')
 
     def user(self, telegram_id: int):
         if telegram_id not in self.__users_cache:
-            user_cache = UserCache(telegram_id=telegram_id)
-            user_cache.state_machine = StateMachine(HabitStates.init, user_cache, STATES_FACTORY)
+            user_cache = UserCache(telegram_id=telegram_id, last_datetime=datetime.now())
             user_cache.messenger = self.__messenger_queue.get_messenger(telegram_id)
+            saved = self.__snapshots.pop(telegram_id, None)
+            if saved is not None:
+                self.__restore(user_cache, saved)
             self.__users_cache[telegram_id] = user_cache
+        else:
+            self.__users_cache.move_to_end(telegram_id)
 
         return self.__users_cache[telegram_id]
 
@@ -53,30 +132,191 @@ class Cache:
         return telegram_id in self.__users_cache
 
     async def setup_user(self, telegram_id: int) -> UserCache:
-        repository = get_backend_repository()
-
         if telegram_id not in self.__users_cache:
             user_cache = UserCache(telegram_id=telegram_id)
-            user_cache.state_machine = StateMachine(HabitStates.init, user_cache, STATES_FACTORY)
             user_cache.messenger = self.__messenger_queue.get_messenger(telegram_id)
         else:
             user_cache = self.__users_cache[telegram_id]
 
-        user = await repository.get_user_info(telegram_id)
+        user = await self.__repository.get_user_info(telegram_id)
         if user is not None:
-            user_cache.backend_id = user.id
-            user_cache.language = user.language
-            user_cache.timezone = user.timezone
+            self.__apply_user(user_cache, user)
         else:
             logger.error(f"{self.__class__.__name__}: setup_user: failed to retrive info for user {telegram_id=}")
 
         return user_cache
 
+    async def init_user(self, telegram_id: int) -> bool:
+        """
+        First contact: loads the user from the backend once. Concurrent updates of
+        the same user share the lookup. Returns False for users not registered yet.
+        """
+        user_cache = self.user(telegram_id)
+        if user_cache.is_inited:
+            return True
+
+        async def lookup() -> bool:
+            user = await self.__repository.get_user_info(telegram_id)
+            if user is None:
+                return False
+            self.__apply_user(user_cache, user)
+            return True
+
+        return await self.__init_flight.do(telegram_id, lookup)
+
+    @staticmethod
+    def __apply_user(user_cache: UserCache, user: User) -> None:
+        user_cache.backend_id = user.id
+        user_cache.language = user.language
+        user_cache.timezone = user.timezone
+        user_cache.is_inited = True
+
+    async def process_eviction(self) -> None:
+        while not self.__should_stop:
+            await asyncio.sleep(config.USER_CACHE_EVICTION_INTERVAL_SECONDS)
+            try:
+                self.evict()
+            except Exception as e:
+                logger.exception(e)
+
+    async def process_snapshots(self) -> None:
+        if self.__snapshot_path is None:
+            return
+        while not self.__should_stop:
+            await asyncio.sleep(config.USER_SNAPSHOT_INTERVAL_SECONDS)
+            try:
+                await self.save_snapshot()
+            except Exception as e:
+                logger.exception(e)
+
+    def stop(self) -> None:
+        self.__should_stop = True
+
+    def load_snapshot(self) -> None:
+        if self.__snapshot_path is None:
+            return
+        try:
+            loaded = snapshot.load(self.__snapshot_path)
+        except (OSError, SnapshotError) as e:
+            logger.error(f"{self.__class__.__name__}: ignoring snapshot: {e}")
+            return
+        newest = sorted(loaded.values(), key=lambda s: s.last_seen)[-self.__snapshot_max_entries:]
+        self.__snapshots = {s.telegram_id: s for s in newest}
+        self.__prune_snapshots(datetime.now())
+        logger.info(f"{self.__class__.__name__}: loaded {len(self.__snapshots)} sessions from {self.__snapshot_path}")
+
+    async def save_snapshot(self) -> None:
+        if self.__snapshot_path is None:
+            return
+
+        self.__prune_snapshots(datetime.now())
+        records = dict(self.__snapshots)
+        for telegram_id, user_cache in self.__users_cache.items():
+            if user_cache.is_registered():
+                records[telegram_id] = self.__snapshot_of(user_cache)
+
+        # Records are taken on the loop, only encoding and IO go to a thread
+        count = await asyncio.to_thread(snapshot.dump, list(records.values()), self.__snapshot_path)
+        logger.info(f"{self.__class__.__name__}: saved {count} sessions to {self.__snapshot_path}")
+
+    def evict(self) -> int:
+        now = datetime.now()
+        self.__prune_snapshots(now)
+        estimated_bytes = sum(self.__estimate_bytes(u) for u in self.__users_cache.values())
+
+        evicted = 0
+        for telegram_id, user_cache in list(self.__users_cache.items()):
+            over_budget = (len(self.__users_cache) > self.__max_entries
+                           or estimated_bytes + self.__snapshots_bytes() > self.__memory_budget_bytes)
+            is_idle = user_cache.last_datetime is None or now - user_cache.last_datetime >= self.__idle_ttl
+            if not (over_budget or is_idle):
+                # Entries are in LRU order, the rest are more recent
+                break
+
+            if not self.__can_evict(user_cache):
+                continue
+
+            del self.__users_cache[telegram_id]
+            self.__messenger_queue.release_messenger(telegram_id)
+            if user_cache.is_registered():
+                self.__keep_snapshot(self.__snapshot_of(user_cache))
+            estimated_bytes -= self.__estimate_bytes(user_cache)
+            evicted += 1
+
+        # Entries left are busy or recent, make room by forgetting the oldest sessions instead
+        dropped = 0
+        while self.__snapshots and estimated_bytes + self.__snapshots_bytes() > self.__memory_budget_bytes:
+            del self.__snapshots[next(iter(self.__snapshots))]
+            dropped += 1
+        self.__snapshots_dropped.inc(dropped)
+
+        # Messengers created without a user entry (e.g. by the web endpoint)
+        self.__messenger_queue.evict_idle(self.__idle_ttl.total_seconds(), keep=self.__users_cache)
+
+        self.__estimated_bytes = estimated_bytes + self.__snapshots_bytes()
+        self.__evictions.inc(evicted)
+        if evicted:
+            logger.info(f"{self.__class__.__name__}: evicted {evicted} users, {len(self.__users_cache)} left")
+        return evicted
+
+    def __can_evict(self, user_cache: UserCache) -> bool:
+        # Pending sends would lose their messenger, registration would be restarted from scratch
+        if not self.__messenger_queue.is_idle(user_cache.telegram_id):
+            return False
+        return user_cache.is_switchable()
+
+    def __keep_snapshot(self, saved: UserSnapshot) -> None:
+        # Appended last, so the dict stays ordered from the least recently seen
+        self.__snapshots.pop(saved.telegram_id, None)
+        self.__snapshots[saved.telegram_id] = saved
+        if len(self.__snapshots) > self.__snapshot_max_entries:
+            del self.__snapshots[next(iter(self.__snapshots))]
+            self.__snapshots_dropped.inc()
+
+    def __prune_snapshots(self, now: datetime) -> None:
+        oldest = now - self.SNAPSHOT_MAX_AGE
+        self.__snapshots = {tid: s for tid, s in self.__snapshots.items() if s.last_seen >= oldest}
+
+    def __snapshots_bytes(self) -> int:
+        return self.SNAPSHOT_ENTRY_BYTES * len(self.__snapshots)
+
+    def __snapshot_of(self, user_cache: UserCache) -> UserSnapshot:
+        main_message_id, text_hash, markup_hash = user_cache.messenger.main_message
+        state = user_cache.state
+        return UserSnapshot(
+            telegram_id=user_cache.telegram_id,
+            backend_id=user_cache.backend_id,
+            language=user_cache.language,
+            timezone=user_cache.timezone,
+            main_message_id=main_message_id,
+            text_hash=text_hash,
+            markup_hash=markup_hash,
+            state=state if state in self.RESTORABLE_STATES else None,
+            last_seen=user_cache.last_datetime or datetime.now(),
+        )
+
+    def __restore(self, user_cache: UserCache, saved: UserSnapshot) -> None:
+        user_cache.backend_id = saved.backend_id
+        user_cache.language = saved.language
+        user_cache.timezone = saved.timezone
+        # The backend already knows this user, no need to ask again on first contact
+        user_cache.is_inited = saved.backend_id is not None
+        if saved.state in self.RESTORABLE_STATES:
+            user_cache.restore_state(saved.state)
+        if saved.main_message_id is not None:
+            user_cache.messenger.restore_main_message(saved.main_message_id, saved.text_hash, saved.markup_hash)
+        self.__restored.inc()
+
+    def __estimate_bytes(self, user_cache: UserCache) -> int:
+        tracked = user_cache.messenger.tracked_messages_count() if user_cache.messenger is not None else 0
+        return self.ENTRY_BASE_BYTES + self.MESSAGE_ID_BYTES * tracked
+
 
 cache: Cache | None = None
 
 
-def setup_cache(messenger_queue: MessengerQueue):
+def setup_cache(messenger_queue: MessengerQueue) -> Cache:
     global cache
 
     cache = Cache(messenger_queue)
+    return cache
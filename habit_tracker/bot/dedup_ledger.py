@@ -0,0 +1,178 @@
+"""
+Expiring set of already delivered events, e.g. reminders, so an event that shows up
+again (overlapping fetches, retries, a restart) is not delivered twice.
+
+Keys are tuples of ints, stored as 64-bit digests in a ring of time buckets: a key
+lives in the bucket of its event time and is forgotten once the bucket falls out of
+the retention window, or earlier when the ledger reaches `max_entries`.
+
+File layout (little endian):
+    header: magic b'HTDL', version u16, bucket seconds u32, bucket count u32
+    bucket: bucket index i64, key count u32, then the keys as u64
+"""
+from __future__ import annotations
+
+import hashlib
+import math
+import struct
+from array import array
+from collections.abc import Iterable
+
+from core.metrics import metrics
+
+MAGIC = b'HTDL'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sHII')
+_BUCKET = struct.Struct('<qI')
+
+
+class LedgerError(Exception):
+    pass
+
+
+def _digest(key: Iterable[int]) -> int:
+    packed = b''.join(int(part).to_bytes(8, 'little', signed=True) for part in key)
+    return int.from_bytes(hashlib.blake2b(packed, digest_size=8).digest(), 'little')
+
+
+class DedupLedger:
+    __slots__ = ('__bucket_seconds', '__max_entries', '__indexes', '__buckets', '__size',
+                 '__evicted', '__dirty')
+
+    def __init__(self, name: str, retention_seconds: float, max_entries: int, bucket_seconds: int = 60) -> None:
+        self.__bucket_seconds = bucket_seconds
+        self.__max_entries = max_entries
+        slots = math.ceil(retention_seconds / bucket_seconds) + 1
+        # Slot i holds the keys of bucket index __indexes[i], -1 when empty
+        self.__indexes: list[int] = [-1] * slots
+        self.__buckets: list[set[int]] = [set() for _ in range(slots)]
+        self.__size = 0
+        self.__dirty = False
+
+        metrics.gauge('dedup_ledger_entries', 'Keys remembered by the ledger', {'ledger': name},
+                      callback=lambda: self.__size)
+        self.__evicted = metrics.counter('dedup_ledger_evictions_total',
+                                         'Keys forgotten before their retention because the ledger was full',
+                                         {'ledger': name})
+
+    def __len__(self) -> int:
+        return self.__size
+
+    @property
+    def dirty(self) -> bool:
+        """True when keys were added since the last to_bytes()."""
+        return self.__dirty
+
+    def add(self, key: Iterable[int], at: float) -> bool:
+        """
+        Records `key` for an event at unix time `at`. Returns False when it is already
+        recorded, i.e. the event was delivered before. Events older than the retention
+        window cannot be recorded and always count as new.
+        """
+        index = int(at // self.__bucket_seconds)
+        slot = index % len(self.__indexes)
+        if self.__indexes[slot] != index:
+            if self.__indexes[slot] > index:
+                return True
+            self.__reset(slot, index)
+
+        digest = _digest(key)
+        bucket = self.__buckets[slot]
+        if digest in bucket:
+            return False
+
+        if self.__size >= self.__max_entries:
+            self.__evict_oldest(keep=slot)
+            if self.__size >= self.__max_entries:
+                # Only the current bucket is left, growing it would break the bound
+                self.__evicted.inc()
+                return True
+
+        bucket.add(digest)
+        self.__size += 1
+        self.__dirty = True
+        return True
+
+    def seen(self, key: Iterable[int], at: float) -> bool:
+        """True when `key` is recorded for an event at unix time `at`."""
+        index = int(at // self.__bucket_seconds)
+        slot = index % len(self.__indexes)
+        return self.__indexes[slot] == index and _digest(key) in self.__buckets[slot]
+
+    def to_bytes(self) -> bytes:
+        """Encodes the ledger in the file layout, see load()."""
+        chunks = []
+        buckets = 0
+        for index, bucket in zip(self.__indexes, self.__buckets):
+            if index < 0 or not bucket:
+                continue
+            chunks.append(_BUCKET.pack(index, len(bucket)))
+            chunks.append(array('Q', bucket).tobytes())
+            buckets += 1
+
+        self.__dirty = False
+        return _HEADER.pack(MAGIC, VERSION, self.__bucket_seconds, buckets) + b''.join(chunks)
+
+    def load(self, path: str) -> int:
+        """Merges keys saved from to_bytes(), returns the number of keys loaded. A missing file is not an error."""
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return 0
+
+        if len(data) < _HEADER.size:
+            raise LedgerError(f'{path}: truncated header')
+        magic, version, bucket_seconds, buckets = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise LedgerError(f'{path}: not a dedup ledger')
+        if version != VERSION:
+            raise LedgerError(f'{path}: unsupported ledger version {version}')
+        if bucket_seconds != self.__bucket_seconds:
+            raise LedgerError(f'{path}: bucket size changed from {bucket_seconds}s to {self.__bucket_seconds}s')
+
+        loaded = 0
+        offset = _HEADER.size
+        try:
+            for _ in range(buckets):
+                index, count = _BUCKET.unpack_from(data, offset)
+                offset += _BUCKET.size
+                end = offset + count * 8
+                if end > len(data):
+                    raise struct.error('bucket runs past the end of the ledger')
+                keys = array('Q')
+                keys.frombytes(data[offset:end])
+                offset = end
+
+                slot = index % len(self.__indexes)
+                if self.__indexes[slot] > index:
+                    # Already out of the retention window
+                    continue
+                if self.__indexes[slot] != index:
+                    self.__reset(slot, index)
+                bucket = self.__buckets[slot]
+                before = len(bucket)
+                bucket.update(keys)
+                self.__size += len(bucket) - before
+                loaded += len(bucket) - before
+        except struct.error as e:
+            raise LedgerError(f'{path}: corrupted ledger: {e}') from e
+
+        while self.__size > self.__max_entries:
+            self.__evict_oldest()
+        return loaded
+
+    def __reset(self, slot: int, index: int) -> None:
+        self.__size -= len(self.__buckets[slot])
+        self.__buckets[slot] = set()
+        self.__indexes[slot] = index
+
+    def __evict_oldest(self, keep: int = -1) -> None:
+        candidates = [slot for slot, index in enumerate(self.__indexes)
+                      if index >= 0 and slot != keep and self.__buckets[slot]]
+        if not candidates:
+            return
+        slot = min(candidates, key=lambda s: self.__indexes[s])
+        self.__evicted.inc(len(self.__buckets[slot]))
+        self.__reset(slot, -1)
@@ -1,14 +1,22 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import logging
+import time
+from array import array
 from functools import partial
 from itertools import chain
 from collections import deque
+from collections.abc import Callable, Coroutine
+from dataclasses import dataclass
+from enum import IntEnum
 
 from aiogram.types import Message
-from aiogram.exceptions import TelegramAPIError
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
 
 import bot
+from core.metrics import metrics
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
@@ -18,69 +26,269 @@ if TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 
 
+
+class Lane(IntEnum):
+    """Priority class of an outbound task, lower value is served first."""
+    interactive = 0
+    reminder = 1
+    background = 2
+
+
+queue_wait_seconds = {
+    lane: metrics.histogram('messenger_queue_wait_seconds', 'Time an outbound task waits in the messenger queue',
+                            {'lane': lane.name})
+    for lane in Lane
+}
+superseded_main_updates = metrics.counter('messenger_main_updates_superseded_total',
+                                          'Pending main message renders dropped in favour of a newer one')
+
+skipped_renders = metrics.counter('messenger_renders_skipped_total',
+                                  'Main message renders skipped because the content was unchanged')
+
+
+def render_hash(value: str | InlineKeyboardMarkup | None) -> int:
+    if value is None:
+        return 0
+    data = value if isinstance(value, str) else value.model_dump_json(exclude_none=True)
+    return int.from_bytes(hashlib.blake2b(data.encode(), digest_size=8).digest())
+
+
+@dataclass(slots=True)
+class QueuedTask:
+    enqueued_at: float
+    run: Callable[[], Coroutine]
+    superseded: bool = False
+
+
 class Messenger:
-    def __init__(self, telegram_id: int) -> None:
+    __slots__ = (
+        '__telegram_id',
+        '__main_message_id',
+        '__main_text_hash',
+        '__main_markup_hash',
+        '__recv_messages_ids',
+        '__sent_messages_ids',
+        '__lanes',
+        '__pending_main_update',
+        '__on_ready',
+        '__last_enqueued_at',
+    )
+    # deleteMessages accepts at most 100 ids per call
+    DELETE_BATCH_SIZE = 100
+    # Ids beyond this are forgotten oldest first, Telegram refuses to delete old messages anyway
+    MAX_TRACKED_MESSAGES = 200
+    # Edit errors after which the main message has to be sent anew
+    EDIT_IMPOSSIBLE_REASONS = (
+        'message to edit not found',
+        "message can't be edited",
+        'MESSAGE_ID_INVALID',
+    )
+    # The message already shows the render, only the stored hashes were out of date
+    NOT_MODIFIED_REASON = 'message is not modified'
+
+    def __init__(self, telegram_id: int, on_ready: Callable[[Messenger], None] | None = None) -> None:
         self.__telegram_id = telegram_id
         self.__main_message_id: int | None = None
-        self.__recv_messages_ids = []
-        self.__sent_messages_ids = []
+        # 64-bit digests of what the main message currently shows
+        self.__main_text_hash = 0
+        self.__main_markup_hash = 0
+        self.__recv_messages_ids = array('q')
+        self.__sent_messages_ids = array('q')
+
+        # Allocated only while something is queued
+        self.__lanes: dict[Lane, deque[QueuedTask]] | None = None
+        # Only the latest render of the main message is worth sending, older pending ones are skipped
+        self.__pending_main_update: QueuedTask | None = None
+        self.__on_ready = on_ready
+        self.__last_enqueued_at = time.monotonic()
+
+    @property
+    def telegram_id(self) -> int:
+        return self.__telegram_id
+
+    def has_pending(self) -> bool:
+        return self.__lanes is not None and any(self.__lanes.values())
 
-        self.__queue = deque()
+    @property
+    def last_enqueued_at(self) -> float:
+        return self.__last_enqueued_at
+
+    @property
+    def main_message(self) -> tuple[int | None, int, int]:
+        """Main message id with the hashes of its text and keyboard."""
+        return self.__main_message_id, self.__main_text_hash, self.__main_markup_hash
+
+    def restore_main_message(self, message_id: int, text_hash: int, markup_hash: int) -> None:
+        if self.__main_message_id is None:
+            self.__main_message_id = message_id
+            self.__main_text_hash, self.__main_markup_hash = text_hash, markup_hash
+
+    def tracked_messages_count(self) -> int:
+        return len(self.__recv_messages_ids) + len(self.__sent_messages_ids)
+
+    def next_lane(self) -> Lane | None:
+        for lane, tasks in (self.__lanes or {}).items():
+            if tasks:
+                return lane
+        return None
 
     async def update_main_message(self, text: str, reply_markup: InlineKeyboardMarkup | None = None) -> None:
-        self.__queue.append(
-            partial(self.__update_main_message, text, reply_markup)
+        if self.__pending_main_update is not None:
+            self.__pending_main_update.superseded = True
+            superseded_main_updates.inc()
+
+        self.__pending_main_update = self.__enqueue(
+            partial(self.__update_main_message, text, reply_markup),
+            Lane.interactive,
         )
 
+    async def enqueue_message(self,
+                              text: str,
+                              reply_markup: InlineKeyboardMarkup | None = None,
+                              lane: Lane = Lane.interactive,
+                              track: bool = True,
+                              ) -> asyncio.Future[bool]:
+        """
+        Sends a message below the main one. Untracked messages are not removed with the temp messages.
+        The returned future tells whether Telegram accepted the message once the queue got to it.
+        """
+        delivered = asyncio.get_running_loop().create_future()
+
+        async def run() -> None:
+            try:
+                await self.__send_temp_message(text, reply_markup, track)
+            except BaseException:
+                delivered.set_result(False)
+                raise
+            delivered.set_result(True)
+
+        self.__enqueue(run, lane)
+        return delivered
+
     async def process_message(self) -> None:
-        if self.__queue:
-            task = self.__queue.popleft()
-            await task()
+        # Within a chat lanes are served strictly by priority, fairness between chats is up to the queue
+        for lane, tasks in (self.__lanes or {}).items():
+            while tasks:
+                task = tasks.popleft()
+                if task.superseded:
+                    continue
+                if task is self.__pending_main_update:
+                    self.__pending_main_update = None
+                if not self.has_pending():
+                    self.__lanes = None
+
+                queue_wait_seconds[lane].observe(time.monotonic() - task.enqueued_at)
+                await task.run()
+                return
+
+    def __enqueue(self, run: Callable[[], Coroutine], lane: Lane) -> QueuedTask:
+        if self.__lanes is None:
+            self.__lanes = {lane: deque() for lane in Lane}
+
+        task = QueuedTask(time.monotonic(), run)
+        self.__lanes[lane].append(task)
+        self.__last_enqueued_at = task.enqueued_at
+        if self.__on_ready is not None:
+            self.__on_ready(self)
+        return task
 
     def register_recv_message(self, message_id: int) -> None:
-        self.__recv_messages_ids.append(message_id)
+        self.__track(self.__recv_messages_ids, message_id)
 
-    async def remove_temp_messages(self):
-        for message_id in chain(self.__recv_messages_ids, self.__sent_messages_ids):
-            if message_id == self.__main_message_id:
-                continue
+    def __track(self, message_ids: array, message_id: int) -> None:
+        message_ids.append(message_id)
+        if len(message_ids) > self.MAX_TRACKED_MESSAGES:
+            del message_ids[0]
 
-            logger.warning(f"{self.__class__.__name__}.remove_temp_messages(mm={self.__main_message_id}): {message_id}")
-            try:
-                await self.__remove_message(message_id)
-            except Exception as e:
-                logger.warning(f"{self.__class__.__name__}.remove_temp_messages: {e.__class__.__name__}: {e}")
+    async def remove_temp_messages(self) -> None:
+        message_ids = sorted({
+            message_id
+            for message_id in chain(self.__recv_messages_ids, self.__sent_messages_ids)
+            if message_id != self.__main_message_id
+        })
+        del self.__recv_messages_ids[:]
+        del self.__sent_messages_ids[:]
+
+        # Deletion goes through the queue, the handler does not wait for it
+        for i in range(0, len(message_ids), self.DELETE_BATCH_SIZE):
+            self.__enqueue(
+                partial(self.__remove_messages, message_ids[i:i + self.DELETE_BATCH_SIZE]),
+                Lane.background,
+            )
+
+    async def __remove_messages(self, message_ids: list[int]) -> None:
+        try:
+            await bot.bot_instance.delete_messages(self.__telegram_id, message_ids=message_ids)
+        except TelegramAPIError as e:
+            logger.warning(f"{self.__class__.__name__}.remove_temp_messages({message_ids}): {e.__class__.__name__}: {e}")
 
-        self.__recv_messages_ids.clear()
-        self.__sent_messages_ids.clear()
-    
     async def __remove_message(self, message_id) -> None:
         await bot.bot_instance.delete_message(self.__telegram_id, message_id=message_id)
 
     async def __update_main_message(self, text: str, reply_markup: InlineKeyboardMarkup | None = None) -> None:
+        text_hash, markup_hash = render_hash(text), render_hash(reply_markup)
         try:
-            if self.__main_message_id is not None:
-                await self.__remove_message(self.__main_message_id)
-            self.__main_message_id = None
-        except TelegramAPIError as e:
-            logger.warning(f"{self.__class__.__name__}: update_main_message(mm={self.__main_message_id}): {e.__class__.__name__}: {e}")
-        try:
-            await self.send_message(text, reply_markup)
+            if self.__can_edit_main_message():
+                if text_hash == self.__main_text_hash and markup_hash == self.__main_markup_hash:
+                    skipped_renders.inc()
+                    return
+                try:
+                    await self.__edit_main_message(text, reply_markup, text_hash, markup_hash)
+                    return
+                except TelegramBadRequest as e:
+                    if not any(reason in e.message for reason in self.EDIT_IMPOSSIBLE_REASONS):
+                        raise
+                    logger.warning(f"{self.__class__.__name__}: update_main_message(mm={self.__main_message_id}): "
+                                   f"falling back to send: {e.message}")
+
+            await self.__resend_main_message(text, reply_markup, text_hash, markup_hash)
         except TelegramAPIError as e:
             logger.warning(f"{self.__class__.__name__}: update_main_message(mm={self.__main_message_id}): {e.__class__.__name__}: {e}")
+        except Exception as e:
+            logger.error(f"{self.__class__.__name__}: update_main_message(mm={self.__main_message_id}): {e.__class__.__name__}: {e}")
 
-            match e.message:
-                case 'Bad Request: message to edit not found':
-                    if self.__main_message_id is not None and self.__main_message_id not in self.__sent_messages_ids:
-                        self.__sent_messages_ids.append(self.__main_message_id)
-                    self.__main_message_id = None
+    def __can_edit_main_message(self) -> bool:
+        # Editing keeps the main message where it is, so only do it while nothing was posted below it
+        if self.__main_message_id is None:
+            return False
+        return all(message_id < self.__main_message_id
+                   for message_id in chain(self.__recv_messages_ids, self.__sent_messages_ids))
 
-                    await self.send_message(text, reply_markup)
-                case 'Bad Request: message is not modified: specified new message content and reply markup are exactly the same as a current content and reply markup of the message':
-                    pass
+    async def __edit_main_message(self,
+                                  text: str,
+                                  reply_markup: InlineKeyboardMarkup | None,
+                                  text_hash: int,
+                                  markup_hash: int,
+                                  ) -> None:
+        try:
+            if text_hash != self.__main_text_hash:
+                await self.__edit_message(text, reply_markup)
+            else:
+                await bot.bot_instance.edit_message_reply_markup(
+                    chat_id=self.__telegram_id,
+                    message_id=self.__main_message_id,
+                    reply_markup=reply_markup,
+                )
+        except TelegramBadRequest as e:
+            if self.NOT_MODIFIED_REASON not in e.message:
+                raise
+        self.__main_text_hash, self.__main_markup_hash = text_hash, markup_hash
 
-        except Exception as e:
-            logger.error(f"{self.__class__.__name__}: update_main_message(mm={self.__main_message_id}): {e.__class__.__name__}: {e}")
+    async def __resend_main_message(self,
+                                    text: str,
+                                    reply_markup: InlineKeyboardMarkup | None,
+                                    text_hash: int,
+                                    markup_hash: int,
+                                    ) -> None:
+        if self.__main_message_id is not None:
+            try:
+                await self.__remove_message(self.__main_message_id)
+            except TelegramAPIError as e:
+                logger.warning(f"{self.__class__.__name__}: update_main_message(mm={self.__main_message_id}): {e.__class__.__name__}: {e}")
+            self.__main_message_id = None
+
+        await self.send_message(text, reply_markup)
+        self.__main_text_hash, self.__main_markup_hash = text_hash, markup_hash
 
     async def __edit_message(self, text: str, reply_markup: InlineKeyboardMarkup | None = None) -> Message:
         return await bot.bot_instance.edit_message_text(
@@ -99,5 +307,20 @@ class Messenger:
         if self.__main_message_id is None:
             self.__main_message_id = message.message_id
         else:
-            self.__sent_messages_ids.append(message.message_id)
+            self.__track(self.__sent_messages_ids, message.message_id)
+        return message
+
+    async def __send_temp_message(self,
+                                  text: str,
+                                  reply_markup: InlineKeyboardMarkup | None = None,
+                                  track: bool = True,
+                                  ) -> Message:
+        # Never becomes the main message, so a later render cannot edit it away
+        message = await bot.bot_instance.send_message(
+            chat_id=self.__telegram_id,
+            text=text,
+            reply_markup=reply_markup,
+        )
+        if track:
+            self.__track(self.__sent_messages_ids, message.message_id)
         return message
@@ -1,49 +1,183 @@
 from __future__ import annotations
 import asyncio
 import logging
+import time
 from collections import deque
-from collections.abc import Callable, Coroutine
+from collections.abc import Callable, Container, Coroutine
 
-from bot.messenger import Messenger
+from bot.messenger import Lane, Messenger
+from core.metrics import metrics
 
 
 logger = logging.getLogger(__name__)
 
 
 class MessengerQueue:
-    MAX_MESSAGES_TOTAL = 30
-    MAX_MESSAGES_PER_USER = 1
-    PERIOD_SECONDS = 1
+    # Telegram limits are enforced per call by bot.rate_limiter, this only bounds concurrency
+    MAX_IN_FLIGHT = 30
+    # Share of dispatches each lane gets while all of them have work
+    LANE_WEIGHTS = {
+        Lane.interactive: 6,
+        Lane.reminder: 3,
+        Lane.background: 1,
+    }
+    # A lane whose head has waited this long without the lane being served in the meantime is
+    # dispatched ahead of the weighted order. A lane behind its own backlog is still served and
+    # does not count, e.g. a burst of reminders does not hold back taps.
+    STARVATION_SECONDS = 5.0
     instance: MessengerQueue | None = None
 
     def __init__(self):
-        self.__messengers = {}
-        self.__messengers_queue = deque()
+        self.__messengers: dict[int, Messenger] = {}
+        # Messengers with pending tasks, queued in the lane of their most urgent task.
+        # A messenger promoted to a better lane leaves a stale entry behind, it is skipped on pop.
+        self.__ready: dict[Lane, deque[tuple[float, Messenger]]] = {lane: deque() for lane in Lane}
+        self.__ready_lane: dict[int, Lane] = {}
+        self.__credits: dict[Lane, int] = {lane: 0 for lane in Lane}
+        self.__served_at: dict[Lane, float] = {lane: 0.0 for lane in Lane}
+        self.__busy_ids: set[int] = set()
+        self.__wakeup = asyncio.Event()
+
+        self.__in_flight = asyncio.Semaphore(self.MAX_IN_FLIGHT)
+        self.__running_tasks: set[asyncio.Task] = set()
         self.__should_stop = False
 
+        for lane in Lane:
+            metrics.gauge('messenger_queue_ready', 'Messengers with pending tasks waiting for dispatch',
+                          {'lane': lane.name}, callback=lambda lane=lane: self.__depth(lane))
+        metrics.gauge('messenger_queue_messengers', 'Messengers held by the queue',
+                      callback=lambda: len(self.__messengers))
+        metrics.gauge('messenger_queue_in_flight', 'Messenger tasks currently running',
+                      callback=lambda: len(self.__running_tasks))
+        self.__starved = metrics.counter('messenger_queue_starvation_dispatches_total',
+                                         'Dispatches forced by the starvation guard')
+
     def get_messenger(self, telegram_id: int) -> Messenger:
         if telegram_id not in self.__messengers:
-            self.__messengers[telegram_id] = Messenger(telegram_id)
-            self.__messengers_queue.append(self.__messengers[telegram_id])
+            self.__messengers[telegram_id] = Messenger(telegram_id, self.__on_messenger_ready)
         return self.__messengers[telegram_id]
 
-    async def process_messages(self) -> None:
-        tasks = []
+    def is_idle(self, telegram_id: int) -> bool:
+        """True when the chat has nothing queued or running, so its messenger can be dropped."""
+        messenger = self.__messengers.get(telegram_id)
+        if messenger is None:
+            return True
+        return not (messenger.has_pending() or telegram_id in self.__busy_ids or telegram_id in self.__ready_lane)
+
+    def release_messenger(self, telegram_id: int) -> bool:
+        if not self.is_idle(telegram_id):
+            return False
+        self.__messengers.pop(telegram_id, None)
+        return True
+
+    def evict_idle(self, idle_seconds: float, keep: Container[int] = ()) -> int:
+        """Drops messengers nobody else holds (`keep`) that had nothing to send for `idle_seconds`."""
+        now = time.monotonic()
+        evicted = [
+            telegram_id
+            for telegram_id, messenger in self.__messengers.items()
+            if telegram_id not in keep
+            and now - messenger.last_enqueued_at >= idle_seconds
+            and self.is_idle(telegram_id)
+        ]
+        for telegram_id in evicted:
+            del self.__messengers[telegram_id]
+        return len(evicted)
 
+    async def process_messages(self) -> None:
         while not self.__should_stop:
-            for _ in range(min(len(self.__messengers_queue), self.MAX_MESSAGES_TOTAL)):
-                messenger = self.__messengers_queue.pop()
-                tasks.append(
-                    self.__wrap_task_in_except(messenger.process_message)
-                )
-                self.__messengers_queue.appendleft(messenger)
+            if not self.__ready_lane:
+                self.__wakeup.clear()
+                await self.__wakeup.wait()
+                continue
+
+            # Pick only once a slot is free so the choice reflects the latest arrivals
+            await self.__in_flight.acquire()
+            messenger = self.__next_messenger()
+            if messenger is None:
+                self.__in_flight.release()
+                continue
 
-            await asyncio.gather(*tasks)
-            tasks.clear()
-            await asyncio.sleep(self.PERIOD_SECONDS)
+            self.__dispatch(messenger)
 
     def stop(self) -> None:
         self.__should_stop = True
+        self.__wakeup.set()
+
+    def __on_messenger_ready(self, messenger: Messenger) -> None:
+        telegram_id = messenger.telegram_id
+        lane = messenger.next_lane()
+        if lane is None or telegram_id in self.__busy_ids:
+            return
+
+        queued_lane = self.__ready_lane.get(telegram_id)
+        if queued_lane is not None and queued_lane <= lane:
+            return
+
+        self.__ready_lane[telegram_id] = lane
+        self.__ready[lane].append((time.monotonic(), messenger))
+        self.__wakeup.set()
+
+    def __next_messenger(self) -> Messenger | None:
+        lanes = []
+        for lane, ready in self.__ready.items():
+            while ready and self.__ready_lane.get(ready[0][1].telegram_id) != lane:
+                ready.popleft()
+            if ready:
+                lanes.append(lane)
+            else:
+                self.__credits[lane] = 0
+
+        if not lanes:
+            return None
+
+        now = time.monotonic()
+        # Lanes are collected in priority order, the most urgent starving one goes first
+        starving = [
+            lane for lane in lanes
+            if now - max(self.__ready[lane][0][0], self.__served_at[lane]) >= self.STARVATION_SECONDS
+        ]
+        if starving:
+            lane = starving[0]
+            self.__starved.inc()
+        else:
+            lane = self.__weighted_pick(lanes)
+
+        self.__served_at[lane] = now
+        _, messenger = self.__ready[lane].popleft()
+        del self.__ready_lane[messenger.telegram_id]
+        return messenger
+
+    def __weighted_pick(self, lanes: list[Lane]) -> Lane:
+        # Smooth weighted round robin: interleaves lanes instead of serving them in bursts
+        total = 0
+        best = lanes[0]
+        for lane in lanes:
+            self.__credits[lane] += self.LANE_WEIGHTS[lane]
+            total += self.LANE_WEIGHTS[lane]
+            if self.__credits[lane] > self.__credits[best]:
+                best = lane
+        self.__credits[best] -= total
+        return best
+
+    def __depth(self, lane: Lane) -> int:
+        return sum(1 for queued_lane in self.__ready_lane.values() if queued_lane == lane)
+
+    def __dispatch(self, messenger: Messenger) -> None:
+        self.__busy_ids.add(messenger.telegram_id)
+
+        task = asyncio.create_task(self.__run(messenger))
+        self.__running_tasks.add(task)
+        task.add_done_callback(self.__running_tasks.discard)
+
+    async def __run(self, messenger: Messenger) -> None:
+        try:
+            await self.__wrap_task_in_except(messenger.process_message)
+        finally:
+            self.__in_flight.release()
+            self.__busy_ids.discard(messenger.telegram_id)
+            if messenger.has_pending():
+                self.__on_messenger_ready(messenger)
 
     async def __wrap_task_in_except(self, task: Callable[[], Coroutine]) -> None:
         try:
@@ -1,3 +1,4 @@
+from .mailbox import MailboxMiddleware
 from .user_state import UserStateMiddleware
 
 m = [
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiogram.dispatcher.middlewares.base import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from core.metrics import metrics
+
+
+class _Mailbox:
+    __slots__ = ('lock', 'depth')
+
+    def __init__(self) -> None:
+        # asyncio.Lock wakes waiters in FIFO order, so updates of a chat are handled as they arrived
+        self.lock = asyncio.Lock()
+        self.depth = 0
+
+
+class MailboxMiddleware(BaseMiddleware):
+    """
+    Update-level outer middleware: handles updates of one chat one at a time and in
+    arrival order, so a user's state machine is never entered concurrently, while
+    different chats run in parallel up to `max_concurrency` updates at once.
+    """
+
+    def __init__(self, max_concurrency: int) -> None:
+        self.__mailboxes: dict[int, _Mailbox] = {}
+        self.__concurrency = asyncio.Semaphore(max_concurrency)
+        self.__pending = 0
+
+        metrics.gauge('bot_mailboxes', 'Chats with updates being handled or waiting',
+                      callback=lambda: len(self.__mailboxes))
+        metrics.gauge('bot_mailbox_pending_updates', 'Updates being handled or waiting in a chat mailbox',
+                      callback=lambda: self.__pending)
+        self.__depth = metrics.histogram('bot_mailbox_depth', 'Updates already in the chat mailbox when one arrives',
+                                         buckets=(0, 1, 2, 3, 5, 10, 20))
+        self.__wait_seconds = metrics.histogram('bot_mailbox_wait_seconds',
+                                                'Time an update waits for its chat and a concurrency slot')
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        chat = data.get('event_chat')
+        if chat is None:
+            async with self.__concurrency:
+                return await handler(event, data)
+
+        mailbox = self.__mailboxes.get(chat.id)
+        if mailbox is None:
+            mailbox = self.__mailboxes[chat.id] = _Mailbox()
+
+        self.__depth.observe(mailbox.depth)
+        mailbox.depth += 1
+        self.__pending += 1
+        arrived_at = time.monotonic()
+        try:
+            async with mailbox.lock:
+                async with self.__concurrency:
+                    self.__wait_seconds.observe(time.monotonic() - arrived_at)
+                    return await handler(event, data)
+        finally:
+            mailbox.depth -= 1
+            self.__pending -= 1
+            if mailbox.depth == 0:
+                del self.__mailboxes[chat.id]
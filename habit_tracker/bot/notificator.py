@@ -3,10 +3,27 @@ from __future__ import annotations
 import logging
 import asyncio
 import datetime
+import heapq
+import time
+from collections import deque
+from collections.abc import Iterable
+from functools import partial
 
+import numpy as np
+
+import config
 from bot import cache
+from bot.dedup_ledger import DedupLedger, LedgerError
+from bot.messenger import Lane
 from core import localizator
+from core.files import write_atomic
+from core.metrics import metrics
+from core.timezone_utils import SECONDS_PER_DAY, timezones
+from core.ttl_cache import TTLCache
 from data.factory import get_backend_repository
+from data.repositories.backend_repository.backend_repository import HabitChange
+from data.schemas import HabitRepeatType
+from data.schemas.notification_batch import MISSING, NotificationBatch, format_hhmm
 
 from typing import TYPE_CHECKING
 
@@ -14,6 +31,7 @@ if TYPE_CHECKING:
     from bot.cache import UserCache
     from bot.messenger_queue import MessengerQueue
     from data.repositories.backend_repository.backend_repository import BackendRepository
+    from data.schemas import Habit
     from data.schemas.notification import Notification
 
 
@@ -21,114 +39,524 @@ UserId = int
 HabitId = int
 # Dedup key: (user_id, habit_id, notification_id or -1, time_in_seconds or -1)
 SendNotificationsKey = tuple[int, int, int, int]
+# SendNotificationsKey and the ordinal of the UTC fire date, as recorded in the dedup ledger
+SentKey = tuple[int, int, int, int, int]
+# (fire_at, habit generation, notification, ledger key) of a reminder handed to the workers
+PendingReminder = tuple[float, int, 'Notification', SentKey]
 
 logger = logging.getLogger(__name__)
 
 
 class Notificator:
-    PERIOD_SECONDS = 10
+    """
+    Keeps the reminders of the next `horizon_seconds` in a heap ordered by fire time
+    and sends each one at its second. The horizon is fetched from the backend every
+    `reconcile_seconds` and at every UTC midnight, habit changes made through the bot
+    are applied in between by refetching only the changed habits. Fetches run beside
+    the dispatch loop, loaded reminders keep firing while the backend is slow.
+    """
+    # The window starts this far in the past, so reminders at the current second are not missed
     PERIOD_OVERLAP = 2
+    # Pause before the next attempt when the backend could not be reached or a send failed
+    RETRY_SECONDS = 10
+    # A reminder that could not be sent is retried until it is this late
+    SEND_RETRY_SECONDS = 10 * 60
+    # Sent reminders are written to the dedup ledger file at most this often, and on shutdown
+    LEDGER_SAVE_SECONDS = 5
+    # Backend lookups in flight at once while resolving telegram ids and habit names
+    RESOLVE_CONCURRENCY = 8
 
-    def __init__(self, message_queue: MessengerQueue, backend_repository: BackendRepository):
+    def __init__(self,
+                 message_queue: MessengerQueue,
+                 backend_repository: BackendRepository,
+                 horizon_seconds: int = config.NOTIFICATOR_HORIZON_SECONDS,
+                 reconcile_seconds: float = config.NOTIFICATOR_RECONCILE_SECONDS,
+                 change_debounce_seconds: float = config.NOTIFICATOR_CHANGE_DEBOUNCE_SECONDS,
+                 dedup_retention_seconds: float = config.NOTIFICATOR_DEDUP_RETENTION_SECONDS,
+                 dedup_max_entries: int = config.NOTIFICATOR_DEDUP_MAX_ENTRIES,
+                 dedup_path: str | None = config.NOTIFICATOR_DEDUP_PATH,
+                 workers: int = config.NOTIFICATOR_WORKERS,
+                 resolve_ttl_seconds: float = config.NOTIFICATOR_RESOLVE_CACHE_TTL_SECONDS,
+                 resolve_max_entries: int = config.NOTIFICATOR_RESOLVE_CACHE_MAX_ENTRIES,
+                 ):
         self.__messenger_queue = message_queue
         self.__backend_repository = backend_repository
+        self.__horizon_seconds = horizon_seconds
+        self.__reconcile_seconds = min(reconcile_seconds, horizon_seconds)
+        self.__change_debounce_seconds = change_debounce_seconds
         self.__should_stop = False
-        self.__previously_sent_notifications: set[SendNotificationsKey] = set()
-        self.__telegram_id_by_user_id: dict[int, int] = {}
-        self.__habit_name_by_id: dict[int, str] = {}
+        self.__wakeup = asyncio.Event()
 
-    async def process_notifications(self) -> None:
-        while not self.__should_stop:
-            now = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=self.PERIOD_OVERLAP)
-            notifications: list[Notification] | None = None
+        # (fire_at unix time, sequence, habit generation, batch, row), rows become Notifications when due
+        self.__schedule: list[tuple[int, int, int, NotificationBatch, int]] = []
+        self.__sequence = 0
+        # Bumped when a habit changes, entries pushed under an older generation are dropped on pop
+        self.__generations: dict[HabitId, int] = {}
+        self.__loaded_until = 0.0
+        self.__next_reload_at = 0.0
+        # Changed habits waiting for a fetch, with their owner when the change told it
+        self.__changed_habits: dict[HabitId, UserId | None] = {}
+        self.__changes_due_at = 0.0
+        # Deleted since the last full fetch was started, that fetch may still return them
+        self.__deleted_habits: set[HabitId] = set()
 
-            try:
-                notifications = await self.__backend_repository.get_notifications_for_period(
-                    now, self.PERIOD_SECONDS + self.PERIOD_OVERLAP,
-                )
-            except Exception as e:
-                logger.error(f"Failed to retrieve notifications for {now}: {e.__class__.__name__}:{e}")
-
-            if notifications is not None:
-                not_sent_notifications: list[Notification] = []
-
-                for n in notifications:
-                    user_id = getattr(n, 'user_id', None)
-                    if user_id is None:
-                        # Cannot route without user_id; skip with error
-                        logger.error(f"Notification {n.notification_id} missing user_id; skipping")
-                        continue
-                    key: SendNotificationsKey = (
-                        int(user_id),
-                        int(n.habit_id),
-                        int(n.notification_id) if n.notification_id is not None else -1,
-                        int(n.time_in_seconds) if n.time_in_seconds is not None else -1,
-                    )
-                    if key not in self.__previously_sent_notifications:
-                        not_sent_notifications.append(n)
-
-                self.__previously_sent_notifications.clear()
-
-                for n in not_sent_notifications:
-                    user_id = n.user_id
-                    if user_id is None:
-                        continue
-                    key: SendNotificationsKey = (
-                        int(user_id),
-                        int(n.habit_id),
-                        int(n.notification_id) if n.notification_id is not None else -1,
-                        int(n.time_in_seconds) if n.time_in_seconds is not None else -1,
-                    )
-
-                    try:
-                        # Resolve telegram id
-                        if user_id in self.__telegram_id_by_user_id:
-                            telegram_id = self.__telegram_id_by_user_id[user_id]
-                        else:
-                            user = await self.__backend_repository.get_user(user_id)
-                            telegram_id = user.telegram_account.telegram_id
-                            assert telegram_id is not None
-                            self.__telegram_id_by_user_id[user_id] = telegram_id
-
-                        user_cache = cache.cache.user(telegram_id)
-                        if not user_cache.is_inited:
-                            await cache.cache.setup_user(telegram_id)
-
-                        # Resolve habit name
-                        habit_name = n.habit_name
-                        if not habit_name:
-                            if n.habit_id in self.__habit_name_by_id:
-                                habit_name = self.__habit_name_by_id[n.habit_id]
-                            else:
-                                habit = await self.__backend_repository.get_habit_by_user_id_and_id(user_id, n.habit_id)
-                                habit_name = habit.name
-                                self.__habit_name_by_id[n.habit_id] = habit_name
-
-                        messenger = self.__messenger_queue.get_messenger(telegram_id)
-
-                        await messenger.send_message(
-                            self.__generate_message(user_cache, habit_name, n)
-                        )
-                    except Exception as e:
-                        logger.exception(e)
-                    self.__previously_sent_notifications.add(key)
-            else:
-                logger.error(f"Notificator: failed to get notifications for {now}")
+        # Reminders already sent, by SentKey, across reloads and restarts
+        self.__sent_notifications = DedupLedger('notificator', dedup_retention_seconds, dedup_max_entries)
+        # Reminders handed to the workers, queued in a messenger or waiting for a retry.
+        # They are recorded as sent only once Telegram accepted the message.
+        self.__in_flight: set[SentKey] = set()
+        # (retry_at, sequence, user_id, reminder) of failed sends
+        self.__retries: list[tuple[float, int, UserId, PendingReminder]] = []
+        self.__dedup_path = dedup_path or None
+        self.__ledger_saved_at = 0.0
+        # Due reminders per user, drained by one worker at a time so a user gets them in order
+        self.__workers = workers
+        self.__pending: dict[UserId, deque[PendingReminder]] = {}
+        self.__ready_users: asyncio.Queue[UserId] = asyncio.Queue()
+
+        # Resolved ahead of time for the whole horizon, habit names are dropped when the bot changes the habit
+        self.__telegram_id_by_user_id = TTLCache('notificator_telegram_ids', resolve_ttl_seconds, resolve_max_entries)
+        self.__habit_name_by_id = TTLCache('notificator_habit_names', resolve_ttl_seconds, resolve_max_entries)
+        self.__prefetch: asyncio.Task | None = None
+        # At most one fetch at a time, it runs beside the dispatch loop and applies its result when it lands
+        self.__reloading: asyncio.Task | None = None
+
+        metrics.gauge('notificator_scheduled', 'Reminders waiting in the schedule, including dropped entries',
+                      callback=lambda: len(self.__schedule))
+        self.__loads = {
+            kind: metrics.counter('notificator_schedule_loads_total', 'Schedule fetches from the backend',
+                                  {'kind': kind})
+            for kind in ('full', 'changes')
+        }
+        self.__load_failures = metrics.counter('notificator_schedule_load_failures_total',
+                                               'Schedule fetches that failed')
+        self.__duplicates = metrics.counter('notificator_duplicates_skipped_total',
+                                            'Reminders not sent because they were already sent or being sent')
+        self.__retried = metrics.counter('notificator_send_retries_total', 'Failed reminder sends queued for a retry')
+        metrics.gauge('notificator_pending_users', 'Users with due reminders waiting for a worker or being sent',
+                      callback=lambda: len(self.__pending))
+        self.__lag = metrics.histogram('notificator_dispatch_lag_seconds',
+                                       'Delay from the scheduled time of a reminder to handing it to its messenger',
+                                       buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600))
+
+        backend_repository.subscribe(self.__on_habit_change)
+
+    async def process_notifications(self) -> None:
+        workers = [asyncio.create_task(self.__worker()) for _ in range(self.__workers)]
+        try:
+            while not self.__should_stop:
+                now = time.time()
+                if not self.__is_reloading():
+                    if now >= self.__next_reload_at:
+                        self.__start_reload(now)
+                    elif self.__changed_habits and now >= self.__changes_due_at:
+                        self.__start_reload(now, only_changed=True)
 
-            await asyncio.sleep(self.PERIOD_SECONDS)
+                self.__dispatch_due(time.time())
+                if time.time() - self.__ledger_saved_at >= self.LEDGER_SAVE_SECONDS:
+                    await self.save_ledger()
+                await self.__sleep()
+        finally:
+            for task in (self.__prefetch, self.__reloading):
+                if task is not None:
+                    workers.append(task)
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
 
     def stop(self) -> None:
         self.__should_stop = True
+        self.__wakeup.set()
+
+    def load_ledger(self) -> None:
+        if self.__dedup_path is None:
+            return
+        try:
+            loaded = self.__sent_notifications.load(self.__dedup_path)
+        except (OSError, LedgerError) as e:
+            logger.error(f"{self.__class__.__name__}: ignoring dedup ledger: {e}")
+            return
+        logger.info(f"{self.__class__.__name__}: loaded {loaded} sent reminders from {self.__dedup_path}")
+
+    async def save_ledger(self) -> None:
+        self.__ledger_saved_at = time.time()
+        if self.__dedup_path is None or not self.__sent_notifications.dirty:
+            return
+        try:
+            await asyncio.to_thread(write_atomic, self.__dedup_path, self.__sent_notifications.to_bytes())
+        except OSError as e:
+            logger.error(f"{self.__class__.__name__}: failed to save dedup ledger: {e}")
+
+    def __on_habit_change(self, change: HabitChange, habit_id: HabitId, user_id: UserId | None) -> None:
+        if change != HabitChange.created:
+            self.__habit_name_by_id.invalidate(habit_id)
+        if change == HabitChange.deleted:
+            # Nothing to fetch, its reminders can go right away
+            self.__generations[habit_id] = self.__generations.get(habit_id, 0) + 1
+            self.__deleted_habits.add(habit_id)
+            self.__changed_habits.pop(habit_id, None)
+            return
+
+        # Creating a habit publishes once per reminder time, coalesce them into one fetch
+        if not self.__changed_habits:
+            self.__changes_due_at = time.time() + self.__change_debounce_seconds
+        self.__mark_changed(habit_id, user_id)
+        self.__wakeup.set()
+
+    def __mark_changed(self, habit_id: HabitId, user_id: UserId | None) -> None:
+        # Reminders added to a habit are published without an owner, keep the one already known
+        if self.__changed_habits.get(habit_id) is None:
+            self.__changed_habits[habit_id] = user_id
+
+    def __is_reloading(self) -> bool:
+        return self.__reloading is not None and not self.__reloading.done()
+
+    def __start_reload(self, now: float, only_changed: bool = False) -> None:
+        self.__reloading = asyncio.create_task(self.__run_reload(now, only_changed))
+
+    async def __run_reload(self, now: float, only_changed: bool) -> None:
+        try:
+            await self.__reload(now, only_changed)
+        except Exception as e:
+            logger.exception(e)
+            retry_at = time.time() + self.RETRY_SECONDS
+            if only_changed:
+                self.__changes_due_at = max(self.__changes_due_at, retry_at)
+            else:
+                self.__next_reload_at = max(self.__next_reload_at, retry_at)
+        finally:
+            # The loop sleeps until the next deadline, which the result may have moved
+            self.__wakeup.set()
+
+    async def __reload(self, now: float, only_changed: bool = False) -> None:
+        changed_habits, self.__changed_habits = self.__changed_habits, {}
+        # The backend applies the day masks of the window's start date, so a window never crosses
+        # UTC midnight: it is cut there and the next day gets a reload of its own
+        midnight = int(now) // SECONDS_PER_DAY * SECONDS_PER_DAY
+        start = datetime.datetime.fromtimestamp(max(now - self.PERIOD_OVERLAP, midnight), datetime.timezone.utc)
+        # A change fetch only needs the part of the horizon that is already loaded
+        if only_changed:
+            end = self.__loaded_until
+        else:
+            end = min(now + self.__horizon_seconds, midnight + SECONDS_PER_DAY)
+        period = max(int(end - start.timestamp()), 0)
+
+        if not only_changed:
+            self.__deleted_habits.clear()
+
+        batch = None
+        unreadable_habits: set[HabitId] = set()
+        try:
+            if only_changed:
+                batch, unreadable_habits = await self.__fetch_changes(changed_habits, start, period)
+            else:
+                batch = await self.__backend_repository.get_notification_batch_for_period(start, period)
+        except Exception as e:
+            logger.error(f"Failed to retrieve notifications for {start}: {e.__class__.__name__}:{e}")
+
+        if batch is None:
+            logger.error(f"Notificator: failed to get notifications for {start}")
+            self.__load_failures.inc()
+            for habit_id, user_id in changed_habits.items():
+                if habit_id not in self.__deleted_habits:
+                    self.__mark_changed(habit_id, user_id)
+            if only_changed:
+                self.__changes_due_at = now + self.RETRY_SECONDS
+            else:
+                self.__next_reload_at = now + self.RETRY_SECONDS
+            return
+
+        batch = self.__schedulable(batch)
+        # Habits changed while the fetch was in flight may be stale in it, they get a fetch of their own
+        stale_habits = self.__changed_habits.keys() | self.__deleted_habits
+        if only_changed:
+            self.__loads['changes'].inc()
+            refreshed = changed_habits.keys() - stale_habits - unreadable_habits
+            # Their scheduled reminders stay as they are until a later fetch can read them
+            if unreadable_habits and not self.__changed_habits:
+                self.__changes_due_at = now + self.RETRY_SECONDS
+            for habit_id in unreadable_habits - stale_habits:
+                self.__mark_changed(habit_id, changed_habits[habit_id])
+            for habit_id in refreshed:
+                self.__generations[habit_id] = self.__generations.get(habit_id, 0) + 1
+            batch = batch.take(np.isin(batch.habit_id, list(refreshed)))
+            self.__push(start, end, batch)
+        else:
+            self.__loads['full'].inc()
+            self.__schedule.clear()
+            self.__generations.clear()
+            if stale_habits:
+                batch = batch.take(~np.isin(batch.habit_id, list(stale_habits)))
+            self.__push(start, end, batch)
+            self.__loaded_until = end
+            self.__next_reload_at = min(now + self.__reconcile_seconds, end)
+
+        # Workers resolve what is still missing when a reminder is due
+        if self.__prefetch is None or self.__prefetch.done():
+            habit_ids, owner_ids = batch.habits_missing_names()
+            self.__prefetch = asyncio.create_task(self.__resolve(
+                np.unique(batch.user_id).tolist(),
+                {user_id for habit_id, user_id in zip(habit_ids.tolist(), owner_ids.tolist())
+                 if habit_id not in self.__habit_name_by_id},
+            ))
+
+    async def __fetch_changes(self,
+                              changed_habits: dict[HabitId, UserId | None],
+                              start: datetime.datetime,
+                              period: int,
+                              ) -> tuple[NotificationBatch | None, set[HabitId]]:
+        """
+        Rows of the changed habits for the window: each habit and its reminders are fetched
+        and the day masks applied here, as the backend does for the window's start date.
+        Also returns the habits that could not be read, they have no rows in the batch.
+        """
+        if None in changed_habits.values():
+            # Cannot look a habit up without its owner, take it from the whole window instead
+            return await self.__backend_repository.get_notification_batch_for_period(start, period), set()
+
+        day = start.date()
+        limit = asyncio.Semaphore(self.RESOLVE_CONCURRENCY)
+
+        async def fetch(habit_id: HabitId, user_id: UserId) -> list[tuple[int, int, int, int, str]] | None:
+            async with limit:
+                habit, notifications = await asyncio.gather(
+                    self.__backend_repository.get_habit_by_user_id_and_id(user_id, habit_id),
+                    self.__backend_repository.get_habit_notifications(habit_id),
+                )
+            if habit is None or notifications is None:
+                # Not readable right now, retried until the next full fetch settles it
+                logger.warning(f"{self.__class__.__name__}: cannot refresh habit {habit_id} of user {user_id}")
+                return None
+            self.__habit_name_by_id.set(habit_id, habit.name)
+            if not self.__is_active(habit, day):
+                return []
+            return [
+                (
+                    user_id,
+                    habit_id,
+                    MISSING if n.notification_id is None else n.notification_id,
+                    MISSING if n.time_in_seconds is None else n.time_in_seconds,
+                    habit.name,
+                )
+                for n in notifications
+            ]
+
+        results = await asyncio.gather(*map(fetch, changed_habits, changed_habits.values()))
+        unreadable = {habit_id for habit_id, habit_rows in zip(changed_habits, results) if habit_rows is None}
+        rows = [row for habit_rows in results if habit_rows is not None for row in habit_rows]
+        names = np.empty(len(rows), dtype=object)
+        names[:] = [row[4] for row in rows]
+        columns = (np.array([row[i] for row in rows], dtype=np.int64) for i in range(4))
+        return NotificationBatch(*columns, names), unreadable
+
+    @staticmethod
+    def __is_active(habit: Habit, day: datetime.date) -> bool:
+        if day < habit.start_date or (habit.end_date is not None and day > habit.end_date):
+            return False
+        # Daily habits ignore the mask
+        return habit.repeat_type == HabitRepeatType.daily or habit.is_day_set(day)
+
+    @staticmethod
+    def __schedulable(batch: NotificationBatch) -> NotificationBatch:
+        routable = batch.routable()
+        unroutable = len(batch) - int(np.count_nonzero(routable))
+        if unroutable:
+            # Cannot route without user_id or time; skip with error
+            logger.error(f"Notificator: {unroutable} notifications missing user_id or time; skipping")
+        batch = batch.take(routable)
+        return batch.take(batch.unique_rows())
+
+    def __push(self, start: datetime.datetime, end: float, batch: NotificationBatch) -> None:
+        fire_times = batch.fire_times(start.timestamp())
+        # Rows at the end of the window, e.g. 00:00 of the next day, belong to the next window
+        in_window = fire_times < end
+        if not in_window.all():
+            batch = batch.take(in_window)
+            fire_times = fire_times[in_window]
+        fire_times = fire_times.tolist()
+        generations = [self.__generations.get(habit_id, 0) for habit_id in batch.habit_id.tolist()]
+        first = self.__sequence + 1
+        self.__sequence += len(fire_times)
+
+        entries = zip(fire_times, range(first, first + len(fire_times)), generations, [batch] * len(fire_times), range(len(fire_times)))
+        if self.__schedule:
+            for entry in entries:
+                heapq.heappush(self.__schedule, entry)
+        else:
+            self.__schedule = list(entries)
+            heapq.heapify(self.__schedule)
+
+    def __dispatch_due(self, now: float) -> None:
+        while self.__schedule and self.__schedule[0][0] <= now:
+            fire_at, _, generation, batch, row = heapq.heappop(self.__schedule)
+            habit_id = int(batch.habit_id[row])
+            if generation != self.__generations.get(habit_id, 0):
+                continue
+
+            user_id = int(batch.user_id[row])
+            key: SendNotificationsKey = (
+                user_id,
+                habit_id,
+                int(batch.notification_id[row]),
+                int(batch.time_in_seconds[row]),
+            )
+            # The schedule is in UTC, the UTC date of the fire time tells occurrences on different days apart
+            fire_date = datetime.datetime.fromtimestamp(fire_at, datetime.timezone.utc).date()
+            sent_key: SentKey = (*key, fire_date.toordinal())
+            if sent_key in self.__in_flight or self.__sent_notifications.seen(sent_key, fire_at):
+                self.__duplicates.inc()
+                continue
+
+            self.__in_flight.add(sent_key)
+            self.__enqueue(user_id, (fire_at, generation, batch.notification(row), sent_key))
+
+        while self.__retries and self.__retries[0][0] <= now:
+            _, _, user_id, reminder = heapq.heappop(self.__retries)
+            _, generation, n, sent_key = reminder
+            if generation != self.__generations.get(n.habit_id, 0):
+                self.__in_flight.discard(sent_key)
+                continue
+            self.__enqueue(user_id, reminder)
+
+    def __enqueue(self, user_id: UserId, reminder: PendingReminder) -> None:
+        queue = self.__pending.get(user_id)
+        if queue is None:
+            self.__pending[user_id] = deque((reminder,))
+            self.__ready_users.put_nowait(user_id)
+        else:
+            queue.append(reminder)
+
+    def __retry(self, user_id: UserId, reminder: PendingReminder) -> None:
+        fire_at, _, n, sent_key = reminder
+        retry_at = time.time() + self.RETRY_SECONDS
+        if retry_at - fire_at > self.SEND_RETRY_SECONDS:
+            logger.error(f"{self.__class__.__name__}: giving up on notification {n.notification_id} "
+                         f"of habit {n.habit_id} for user {user_id}")
+            self.__in_flight.discard(sent_key)
+            return
+
+        self.__retried.inc()
+        self.__sequence += 1
+        heapq.heappush(self.__retries, (retry_at, self.__sequence, user_id, reminder))
+        self.__wakeup.set()
+
+    async def __worker(self) -> None:
+        while True:
+            user_id = await self.__ready_users.get()
+            queue = self.__pending[user_id]
+            # Reminders due while this user is being served are appended to the same queue
+            while queue:
+                reminder = queue[0]
+                fire_at, _, n, _ = reminder
+                delivery = None
+                try:
+                    delivery = await self.__send(user_id, n, fire_at)
+                except Exception as e:
+                    logger.exception(e)
+                if delivery is None:
+                    self.__retry(user_id, reminder)
+                else:
+                    self.__lag.observe(max(time.time() - fire_at, 0))
+                    # The worker moves on, the outcome arrives once the messenger queue got to the message
+                    delivery.add_done_callback(partial(self.__on_delivery, user_id, reminder))
+                queue.popleft()
+            del self.__pending[user_id]
+
+    def __on_delivery(self, user_id: UserId, reminder: PendingReminder, delivery: asyncio.Future[bool]) -> None:
+        fire_at, _, _, sent_key = reminder
+        if delivery.cancelled() or not delivery.result():
+            self.__retry(user_id, reminder)
+            return
+        self.__sent_notifications.add(sent_key, fire_at)
+        self.__in_flight.discard(sent_key)
+
+    async def __send(self, user_id: UserId, n: Notification, fire_at: float) -> asyncio.Future[bool] | None:
+        """Queues the reminder in the user's messenger, returns its delivery or None when it cannot be routed."""
+        telegram_id = self.__telegram_id_by_user_id.get(user_id, None)
+        habit_name = n.habit_name or self.__habit_name_by_id.get(n.habit_id, None)
+        if telegram_id is None or habit_name is None:
+            await self.__resolve((user_id,), () if habit_name is not None else (user_id,))
+            telegram_id = self.__telegram_id_by_user_id.get(user_id, None)
+            habit_name = n.habit_name or self.__habit_name_by_id.get(n.habit_id, None)
+        if telegram_id is None or habit_name is None:
+            logger.error(f"{self.__class__.__name__}: cannot resolve notification {n.notification_id} "
+                         f"of habit {n.habit_id} for user {user_id}")
+            return None
+
+        user_cache = cache.cache.user(telegram_id)
+        if not user_cache.is_inited:
+            await cache.cache.setup_user(telegram_id)
+
+        messenger = self.__messenger_queue.get_messenger(telegram_id)
+
+        return await messenger.enqueue_message(
+            self.__generate_message(user_cache, habit_name, n, fire_at),
+            lane=Lane.reminder,
+        )
+
+    async def __resolve(self, user_ids: Iterable[UserId], habit_owner_ids: Iterable[UserId]) -> None:
+        """
+        Fills the telegram id and habit name caches: one get_user per user not cached
+        yet and one get_habits per user of `habit_owner_ids`, whose habit names are needed.
+        """
+        user_ids = [user_id for user_id in user_ids if user_id not in self.__telegram_id_by_user_id]
+        habit_owner_ids = list(habit_owner_ids)
+
+        limit = asyncio.Semaphore(self.RESOLVE_CONCURRENCY)
+
+        async def resolve_user(user_id: UserId) -> None:
+            async with limit:
+                user = await self.__backend_repository.get_user(user_id)
+            if user is not None and user.telegram_account is not None and user.telegram_account.telegram_id is not None:
+                self.__telegram_id_by_user_id.set(user_id, user.telegram_account.telegram_id)
+
+        async def resolve_habit_names(user_id: UserId) -> None:
+            async with limit:
+                habits = await self.__backend_repository.get_habits(user_id)
+            for habit in habits or ():
+                self.__habit_name_by_id.set(habit.id, habit.name)
+
+        results = await asyncio.gather(
+            *map(resolve_user, user_ids),
+            *map(resolve_habit_names, habit_owner_ids),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"{self.__class__.__name__}: resolve failed: {result.__class__.__name__}:{result}")
+
+    async def __sleep(self) -> None:
+        self.__wakeup.clear()
+        if self.__should_stop:
+            return
+
+        # Reload deadlines matter only once the fetch in flight is done, it wakes the loop then
+        reload_at = None if self.__is_reloading() else self.__next_reload_at
+        deadlines = [reload_at] if reload_at is not None else []
+        if self.__schedule:
+            deadlines.append(self.__schedule[0][0])
+        if self.__retries:
+            deadlines.append(self.__retries[0][0])
+        if self.__changed_habits and reload_at is not None:
+            deadlines.append(self.__changes_due_at)
+
+        timeout = min(deadlines) - time.time() if deadlines else None
+        if timeout is not None and timeout <= 0:
+            return
+        try:
+            await asyncio.wait_for(self.__wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
 
     @staticmethod
-    def __generate_message(user_cache: UserCache, habit_name: str, notification: Notification) -> str:
+    def __generate_message(user_cache: UserCache, habit_name: str, notification: Notification, fire_at: float) -> str:
         l = localizator.localizator.lang(user_cache.language)
 
         # Format time according to user's timezone if available
         local_time_str = '-'
         if notification.time_in_seconds is not None:
-            t = notification.time(user_cache.timezone)
-            local_time_str = f"{t.hour:02}:{t.minute:02}"
+            # The offset at the moment the reminder fires, it may differ from today's across a DST change
+            local_time_str = format_hhmm(notification.time_in_seconds + timezones.offset(user_cache.timezone, fire_at))
         return l.notification.format(
             time=local_time_str,
             name=habit_name,
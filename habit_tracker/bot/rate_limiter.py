@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+from aiogram import methods
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from core.metrics import metrics
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from aiogram import Bot
+
+
+logger = logging.getLogger(__name__)
+
+ChatId = int | str
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated_at', 'blocked_until')
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available, 0 if one can be taken right now."""
+        self.__refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self.__refill(now)
+        self.tokens -= 1
+
+    def block(self, now: float, seconds: float) -> None:
+        # Telegram asked to back off: drain the bucket and refuse tokens until the deadline
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0
+        self.updated_at = self.blocked_until
+
+    def is_idle(self, now: float) -> bool:
+        self.__refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
+
+    def __refill(self, now: float) -> None:
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+
+class RateLimiter:
+    """
+    Token buckets for the Bot API limits: a global budget for every call, plus
+    a per-chat budget for private chats and a per-group budget for groups that
+    only applies to calls posting or editing messages.
+    """
+    GLOBAL_RATE = 30
+    CHAT_RATE = 1
+    GROUP_RATE = 20 / 60
+    GROUP_BURST = 20
+    PRUNE_INTERVAL_SECONDS = 60
+
+    def __init__(self) -> None:
+        self.__global = TokenBucket(self.GLOBAL_RATE, self.GLOBAL_RATE)
+        self.__chats: dict[ChatId, TokenBucket] = {}
+        self.__pruned_at = time.monotonic()
+
+        self.__throttle_seconds = {
+            scope: metrics.histogram('telegram_throttle_delay_seconds', 'Time a Bot API call waited for the rate limiter',
+                                     {'scope': scope})
+            for scope in ('global', 'chat', 'group')
+        }
+        metrics.gauge('telegram_rate_limiter_chats', 'Chats with an active rate limit bucket',
+                      callback=lambda: len(self.__chats))
+
+    async def acquire(self, chat_id: ChatId | None = None) -> None:
+        started = time.monotonic()
+        buckets = [self.__global]
+        scope = 'global'
+        if chat_id is not None:
+            buckets.append(self.__chat_bucket(chat_id))
+            scope = 'group' if self.__is_group(chat_id) else 'chat'
+
+        while True:
+            now = time.monotonic()
+            delay = max(b.delay(now) for b in buckets)
+            if delay <= 0:
+                for b in buckets:
+                    b.take(now)
+                break
+            await asyncio.sleep(delay)
+
+        self.__throttle_seconds[scope].observe(time.monotonic() - started)
+        self.__prune(time.monotonic())
+
+    def retry_after(self, chat_id: ChatId | None, seconds: float) -> None:
+        now = time.monotonic()
+        if chat_id is None:
+            self.__global.block(now, seconds)
+        else:
+            self.__chat_bucket(chat_id).block(now, seconds)
+
+    def __chat_bucket(self, chat_id: ChatId) -> TokenBucket:
+        bucket = self.__chats.get(chat_id)
+        if bucket is None:
+            if self.__is_group(chat_id):
+                bucket = TokenBucket(self.GROUP_RATE, self.GROUP_BURST)
+            else:
+                bucket = TokenBucket(self.CHAT_RATE, self.CHAT_RATE)
+            self.__chats[chat_id] = bucket
+        return bucket
+
+    @staticmethod
+    def __is_group(chat_id: ChatId) -> bool:
+        # Group and channel ids are negative, public channels may be addressed by @username
+        return isinstance(chat_id, str) or chat_id < 0
+
+    def __prune(self, now: float) -> None:
+        # A full bucket carries no state, dropping it keeps the map to recently active chats
+        if now - self.__pruned_at < self.PRUNE_INTERVAL_SECONDS:
+            return
+        self.__pruned_at = now
+        for chat_id in [chat_id for chat_id, bucket in self.__chats.items() if bucket.is_idle(now)]:
+            del self.__chats[chat_id]
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """Session middleware: every outbound Bot API call waits for the limiter, 429 responses are retried."""
+    # Calls that post or edit messages count against the chat budget, everything else only against the global one
+    CHAT_LIMITED_METHODS = (
+        methods.SendMessage,
+        methods.SendPhoto,
+        methods.SendDocument,
+        methods.SendSticker,
+        methods.SendAnimation,
+        methods.SendAudio,
+        methods.SendVideo,
+        methods.SendVoice,
+        methods.SendMediaGroup,
+        methods.SendLocation,
+        methods.ForwardMessage,
+        methods.CopyMessage,
+        methods.EditMessageText,
+        methods.EditMessageCaption,
+        methods.EditMessageReplyMarkup,
+    )
+    # Long polling and bot setup are not subject to the message limits
+    EXEMPT_METHODS = (
+        methods.GetUpdates,
+        methods.GetMe,
+        methods.SetWebhook,
+        methods.DeleteWebhook,
+    )
+    MAX_RETRY_AFTER_ATTEMPTS = 3
+
+    def __init__(self, rate_limiter: RateLimiter) -> None:
+        self.__rate_limiter = rate_limiter
+        self.__retried = metrics.counter('telegram_retry_after_total', 'Bot API calls rejected with 429 and retried')
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if isinstance(method, self.EXEMPT_METHODS):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, 'chat_id', None) if isinstance(method, self.CHAT_LIMITED_METHODS) else None
+
+        attempt = 0
+        while True:
+            attempt += 1
+            await self.__rate_limiter.acquire(chat_id)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt >= self.MAX_RETRY_AFTER_ATTEMPTS:
+                    raise
+                logger.warning(f"{self.__class__.__name__}: {type(method).__name__} chat={chat_id} "
+                               f"flood wait {e.retry_after}s, attempt {attempt}")
+                self.__retried.inc()
+                self.__rate_limiter.retry_after(chat_id, e.retry_after)
@@ -0,0 +1,125 @@
+"""
+Binary snapshot of per-user session data, so a restart does not have to ask the
+backend about every user again and keeps the main message of each chat.
+
+Layout (little endian):
+    header: magic b'HTUC', version u16, record count u32
+    record: telegram_id i64, backend_id i64, main_message_id i64,
+            text_hash u64, markup_hash u64, last_seen f64 (unix time),
+            then language, timezone and state name as u8-length-prefixed utf-8
+-1 stands for a missing id, an empty string for a missing value.
+"""
+from __future__ import annotations
+
+import struct
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import datetime
+
+from bot.states import HabitStates
+from core.files import write_atomic
+from data.schemas.user import LanguageEnum
+
+MAGIC = b'HTUC'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sHI')
+_RECORD = struct.Struct('<qqqQQd')
+_NONE_ID = -1
+
+
+class SnapshotError(Exception):
+    pass
+
+
+@dataclass(slots=True)
+class UserSnapshot:
+    telegram_id: int
+    backend_id: int | None
+    language: LanguageEnum | None
+    timezone: str | None
+    main_message_id: int | None
+    text_hash: int
+    markup_hash: int
+    state: HabitStates | None
+    last_seen: datetime
+
+
+def dump(snapshots: Iterable[UserSnapshot], path: str) -> int:
+    """Writes the snapshot with write_atomic(), returns the number of records."""
+    chunks = []
+    for s in snapshots:
+        chunks.append(_RECORD.pack(
+            s.telegram_id,
+            _NONE_ID if s.backend_id is None else s.backend_id,
+            _NONE_ID if s.main_message_id is None else s.main_message_id,
+            s.text_hash,
+            s.markup_hash,
+            s.last_seen.timestamp(),
+        ))
+        chunks.append(_pack_str(s.language.value if s.language is not None else ''))
+        chunks.append(_pack_str(s.timezone or ''))
+        chunks.append(_pack_str(s.state.name if s.state is not None else ''))
+
+    count = len(chunks) // 4
+    write_atomic(path, _HEADER.pack(MAGIC, VERSION, count) + b''.join(chunks))
+    return count
+
+
+def load(path: str) -> dict[int, UserSnapshot]:
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return {}
+
+    if len(data) < _HEADER.size:
+        raise SnapshotError(f'{path}: truncated header')
+    magic, version, count = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise SnapshotError(f'{path}: not a user snapshot')
+    if version != VERSION:
+        raise SnapshotError(f'{path}: unsupported snapshot version {version}')
+
+    snapshots = {}
+    offset = _HEADER.size
+    try:
+        for _ in range(count):
+            telegram_id, backend_id, main_message_id, text_hash, markup_hash, last_seen = _RECORD.unpack_from(data, offset)
+            offset += _RECORD.size
+            language, offset = _unpack_str(data, offset)
+            timezone, offset = _unpack_str(data, offset)
+            state, offset = _unpack_str(data, offset)
+
+            snapshots[telegram_id] = UserSnapshot(
+                telegram_id=telegram_id,
+                backend_id=None if backend_id == _NONE_ID else backend_id,
+                language=LanguageEnum(language) if language in LanguageEnum._value2member_map_ else None,
+                timezone=timezone or None,
+                main_message_id=None if main_message_id == _NONE_ID else main_message_id,
+                text_hash=text_hash,
+                markup_hash=markup_hash,
+                # States renamed or removed since the snapshot was taken are dropped
+                state=HabitStates.__members__.get(state),
+                last_seen=datetime.fromtimestamp(last_seen),
+            )
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise SnapshotError(f'{path}: corrupted record {len(snapshots)}: {e}') from e
+
+    return snapshots
+
+
+def _pack_str(value: str) -> bytes:
+    encoded = value.encode()
+    if len(encoded) > 255:
+        raise SnapshotError(f'value too long for a snapshot: {value[:32]}...')
+    return bytes((len(encoded),)) + encoded
+
+
+def _unpack_str(data: bytes, offset: int) -> tuple[str, int]:
+    length = data[offset]
+    start = offset + 1
+    end = start + length
+    if end > len(data):
+        raise struct.error('string runs past the end of the snapshot')
+    return data[start:end].decode(), end
@@ -55,6 +55,9 @@ class StateMachine:
     def state(self):
         return self._current_state.state
 
+    def is_switchable(self) -> bool:
+        return self.__is_current_state_switchable()
+
     def is_handable(self, context_type) -> bool:
         return self._current_state.is_handable(context_type)
 
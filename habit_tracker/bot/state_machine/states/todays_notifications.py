@@ -1,15 +1,12 @@
 from __future__ import annotations
-import asyncio
 import logging
-from datetime import datetime
-from zoneinfo import ZoneInfo
-
 from aiogram.types import CallbackQuery, Message, InlineKeyboardMarkup, InlineKeyboardButton
 
 from bot.states import HabitStates
 from bot.state_machine.states_factory import register_state
 from bot.state_machine.states_interfaces import IState
 from core import localizator
+from core.timezone_utils import timezones
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
@@ -62,17 +59,15 @@ class TodaysNotifications(IState):
     async def __update(self) -> None:
         notifications = await self._backend_repository.get_todays_notifications(
             self._user_cache.backend_id,
-            datetime.now(ZoneInfo(self._user_cache.timezone)).date(),
+            timezones.today(self._user_cache.timezone),
         )
         self._notifications = notifications or []
         self._notifications.sort(key=lambda n: (n.time_in_seconds if n.time_in_seconds else float('inf')))
 
-        self._habits.clear()
-        habits = await asyncio.gather(*[
-            self._backend_repository.get_habit_by_user_id_and_id(self._user_cache.backend_id, n.habit_id)
-            for n in self._notifications
-        ])
-        self._habits = {h.id: h for h in habits}
+        self._habits = await self._backend_repository.get_habits_by_ids(
+            self._user_cache.backend_id,
+            (n.habit_id for n in self._notifications),
+        )
 
         await self._update_message()
     
@@ -84,14 +79,17 @@ class TodaysNotifications(IState):
 
     def _construct_keyboard(self):
         keyboard = InlineKeyboardMarkup(inline_keyboard=[])
-        
-        for n in self._notifications[:self.MAX_NOTIFICATIONS]:
-            habit = self._habits[n.habit_id]
+        notifications = self._notifications[:self.MAX_NOTIFICATIONS]
+        local_times = timezones.local_times(self._user_cache.timezone, (n.time_in_seconds or 0 for n in notifications))
+
+        for n, t in zip(notifications, local_times):
+            habit = self._habits.get(n.habit_id)
+            if habit is None:
+                logger.warning(f"{self.__class__.__name__}: habit {n.habit_id} of notification {n.notification_id} not found")
+                continue
 
             if n.time_in_seconds:
-                t = n.time(self._user_cache.timezone)
-                print(t, n.time('utc'), self._user_cache.timezone)
-                n_time = f'{t.hour:02}:{t.minute:02}' if n.time_in_seconds else '-'
+                n_time = f'{t.hour:02}:{t.minute:02}'
                 text = f'{n_time}: {habit.name}'
             else:
                 text = f'{habit.name}'
@@ -15,7 +15,40 @@ ROOT_DIRECTORY = Path(__file__).parent
 LOCALES_DIRECTORY = Path(ROOT_DIRECTORY, '../locales').resolve(strict=True)
 BACKEND_URL = os.getenv('BACKEND_URL')
 
+BACKEND_POOL_LIMIT = int(os.getenv('BACKEND_POOL_LIMIT', 100))
+BACKEND_POOL_LIMIT_PER_HOST = int(os.getenv('BACKEND_POOL_LIMIT_PER_HOST', 30))
+BACKEND_POOL_KEEPALIVE_TIMEOUT = float(os.getenv('BACKEND_POOL_KEEPALIVE_TIMEOUT', 30))
+BACKEND_POOL_DNS_CACHE_TTL = int(os.getenv('BACKEND_POOL_DNS_CACHE_TTL', 300))
+
+BACKEND_REQUEST_TIMEOUT = float(os.getenv('BACKEND_REQUEST_TIMEOUT', 10))
+BACKEND_REQUEST_ATTEMPTS = int(os.getenv('BACKEND_REQUEST_ATTEMPTS', 3))
+BACKEND_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('BACKEND_CIRCUIT_FAILURE_THRESHOLD', 5))
+BACKEND_CIRCUIT_RECOVERY_SECONDS = float(os.getenv('BACKEND_CIRCUIT_RECOVERY_SECONDS', 30))
+
+BACKEND_CACHE_TTL_SECONDS = float(os.getenv('BACKEND_CACHE_TTL_SECONDS', 60))
+BACKEND_CACHE_MAX_ENTRIES = int(os.getenv('BACKEND_CACHE_MAX_ENTRIES', 10000))
+BACKEND_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv('BACKEND_CACHE_NEGATIVE_TTL_SECONDS', 10))
+
+USER_CACHE_IDLE_TTL_SECONDS = float(os.getenv('USER_CACHE_IDLE_TTL_SECONDS', 6 * 60 * 60))
+USER_CACHE_MAX_ENTRIES = int(os.getenv('USER_CACHE_MAX_ENTRIES', 50000))
+USER_CACHE_MEMORY_BUDGET_MB = float(os.getenv('USER_CACHE_MEMORY_BUDGET_MB', 256))
+USER_CACHE_EVICTION_INTERVAL_SECONDS = float(os.getenv('USER_CACHE_EVICTION_INTERVAL_SECONDS', 60))
+USER_SNAPSHOT_PATH = os.getenv('USER_SNAPSHOT_PATH', 'user_cache.snapshot')
+USER_SNAPSHOT_INTERVAL_SECONDS = float(os.getenv('USER_SNAPSHOT_INTERVAL_SECONDS', 300))
+USER_SNAPSHOT_MAX_ENTRIES = int(os.getenv('USER_SNAPSHOT_MAX_ENTRIES', 100_000))
+
+NOTIFICATOR_HORIZON_SECONDS = int(os.getenv('NOTIFICATOR_HORIZON_SECONDS', 60 * 60))
+NOTIFICATOR_RECONCILE_SECONDS = float(os.getenv('NOTIFICATOR_RECONCILE_SECONDS', 15 * 60))
+NOTIFICATOR_CHANGE_DEBOUNCE_SECONDS = float(os.getenv('NOTIFICATOR_CHANGE_DEBOUNCE_SECONDS', 2))
+NOTIFICATOR_WORKERS = int(os.getenv('NOTIFICATOR_WORKERS', 32))
+NOTIFICATOR_RESOLVE_CACHE_TTL_SECONDS = float(os.getenv('NOTIFICATOR_RESOLVE_CACHE_TTL_SECONDS', 6 * 60 * 60))
+NOTIFICATOR_RESOLVE_CACHE_MAX_ENTRIES = int(os.getenv('NOTIFICATOR_RESOLVE_CACHE_MAX_ENTRIES', 100_000))
+NOTIFICATOR_DEDUP_RETENTION_SECONDS = float(os.getenv('NOTIFICATOR_DEDUP_RETENTION_SECONDS', 2 * 60 * 60))
+NOTIFICATOR_DEDUP_MAX_ENTRIES = int(os.getenv('NOTIFICATOR_DEDUP_MAX_ENTRIES', 500_000))
+NOTIFICATOR_DEDUP_PATH = os.getenv('NOTIFICATOR_DEDUP_PATH', 'notificator_dedup.ledger')
+
 BOT_MODE = BotMode(os.getenv('BOT_MODE', BotMode.polling))
+BOT_MAX_CONCURRENT_UPDATES = int(os.getenv('BOT_MAX_CONCURRENT_UPDATES', 100))
 
 WEBHOOK_HOST = os.getenv('WEBHOOK_HOST')
 WEBHOOK_PATH = os.getenv('WEBHOOK_PATH')
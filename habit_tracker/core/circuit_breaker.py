@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections.abc import Callable
+from enum import StrEnum, auto
+
+from core.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitState(StrEnum):
+    closed = auto()
+    open = auto()
+    half_open = auto()
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+StateListener = Callable[[CircuitState, CircuitState], None]
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `recovery_timeout` seconds, then lets a single probe through (half open).
+    A successful probe closes the circuit, a failed one opens it again.
+    """
+    STATE_CODES = {
+        CircuitState.closed: 0,
+        CircuitState.half_open: 1,
+        CircuitState.open: 2,
+    }
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0) -> None:
+        self.__name = name
+        self.__failure_threshold = failure_threshold
+        self.__recovery_timeout = recovery_timeout
+        self.__state = CircuitState.closed
+        self.__failures = 0
+        self.__opened_at = 0.0
+        self.__probe_in_flight = False
+        self.__listeners: list[StateListener] = []
+
+        metrics.gauge('circuit_breaker_state', 'Circuit state: 0 closed, 1 half open, 2 open', {'name': name},
+                      callback=lambda: self.STATE_CODES[self.state])
+
+    @property
+    def state(self) -> CircuitState:
+        if self.__state == CircuitState.open and time.monotonic() - self.__opened_at >= self.__recovery_timeout:
+            self.__transition(CircuitState.half_open)
+        return self.__state
+
+    def add_listener(self, listener: StateListener) -> None:
+        self.__listeners.append(listener)
+
+    def allow_request(self) -> bool:
+        match self.state:
+            case CircuitState.closed:
+                return True
+            case CircuitState.open:
+                return False
+            case CircuitState.half_open:
+                if self.__probe_in_flight:
+                    return False
+                self.__probe_in_flight = True
+                return True
+            case _:
+                raise AssertionError(f"Unexpected circuit state: {self.__state}")
+
+    def record_success(self) -> None:
+        self.__failures = 0
+        self.__probe_in_flight = False
+        if self.__state != CircuitState.closed:
+            self.__transition(CircuitState.closed)
+
+    def record_failure(self) -> None:
+        self.__probe_in_flight = False
+
+        if self.__state == CircuitState.half_open:
+            self.__transition(CircuitState.open)
+            return
+
+        self.__failures += 1
+        if self.__state == CircuitState.closed and self.__failures >= self.__failure_threshold:
+            self.__transition(CircuitState.open)
+
+    def release(self) -> None:
+        """Forget a probe that was cancelled before it produced an outcome."""
+        self.__probe_in_flight = False
+
+    def __transition(self, new_state: CircuitState) -> None:
+        old_state = self.__state
+        self.__state = new_state
+
+        if new_state == CircuitState.open:
+            self.__opened_at = time.monotonic()
+        elif new_state == CircuitState.closed:
+            self.__failures = 0
+
+        metrics.counter('circuit_breaker_transitions_total', 'Circuit state transitions',
+                        {'name': self.__name, 'to': new_state}).inc()
+
+        for listener in self.__listeners:
+            try:
+                listener(old_state, new_state)
+            except Exception as e:
+                logger.exception(e)
@@ -0,0 +1,11 @@
+import os
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """Replaces the file at `path` with `data`: readers see either the old or the new file, never a partial one."""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import bisect
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+
+LabelsKey = tuple[tuple[str, str], ...]
+
+
+def _labels_key(labels: dict[str, Any] | None) -> LabelsKey:
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+
+def _format_labels(labels: LabelsKey, extra: LabelsKey = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in items) + '}'
+
+
+class Counter:
+    def __init__(self) -> None:
+        self.value: float = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Gauge:
+    def __init__(self, callback: Callable[[], float] | None = None) -> None:
+        self._value: float = 0
+        self._callback = callback
+
+    @property
+    def value(self) -> float:
+        if self._callback is not None:
+            return self._callback()
+        return self._value
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self._value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self._value -= amount
+
+
+class Histogram:
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, buckets: tuple[float, ...] | None = None) -> None:
+        self.buckets = tuple(sorted(buckets or self.DEFAULT_BUCKETS))
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.sum: float = 0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+@dataclass
+class _Family:
+    kind: str
+    description: str
+    metrics: dict[LabelsKey, Counter | Gauge | Histogram] = field(default_factory=dict)
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self.__families: dict[str, _Family] = {}
+
+    def counter(self, name: str, description: str, labels: dict[str, Any] | None = None) -> Counter:
+        return self.__get_or_create(name, 'counter', description, labels, Counter)
+
+    def gauge(self,
+              name: str,
+              description: str,
+              labels: dict[str, Any] | None = None,
+              callback: Callable[[], float] | None = None,
+              ) -> Gauge:
+        gauge = self.__get_or_create(name, 'gauge', description, labels, Gauge)
+        if callback is not None:
+            gauge._callback = callback
+        return gauge
+
+    def histogram(self,
+                  name: str,
+                  description: str,
+                  labels: dict[str, Any] | None = None,
+                  buckets: tuple[float, ...] | None = None,
+                  ) -> Histogram:
+        return self.__get_or_create(name, 'histogram', description, labels, lambda: Histogram(buckets))
+
+    def render(self) -> str:
+        lines = []
+
+        for name, family in self.__families.items():
+            lines.append(f'# HELP {name} {family.description}')
+            lines.append(f'# TYPE {name} {family.kind}')
+
+            for labels, metric in family.metrics.items():
+                if isinstance(metric, Histogram):
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets + (float('inf'),), metric.bucket_counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else f'{bound}'
+                        lines.append(f'{name}_bucket{_format_labels(labels, (("le", le),))} {cumulative}')
+                    lines.append(f'{name}_sum{_format_labels(labels)} {metric.sum}')
+                    lines.append(f'{name}_count{_format_labels(labels)} {metric.count}')
+                else:
+                    lines.append(f'{name}{_format_labels(labels)} {metric.value}')
+
+        return '\n'.join(lines) + '\n'
+
+    def __get_or_create(self, name: str, kind: str, description: str, labels: dict[str, Any] | None, factory: Callable[[], Any]):
+        family = self.__families.get(name)
+        if family is None:
+            family = self.__families[name] = _Family(kind, description)
+        assert family.kind == kind, f'{self.__class__.__name__}: metric {name} already registered as {family.kind}'
+
+        key = _labels_key(labels)
+        if key not in family.metrics:
+            family.metrics[key] = factory()
+        return family.metrics[key]
+
+
+metrics = MetricsRegistry()
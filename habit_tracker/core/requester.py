@@ -1,15 +1,26 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+
 import aiohttp
 from typing import Any
 import logging
 
-from pydantic import BaseModel
+from core.circuit_breaker import CircuitBreaker, CircuitOpenError, CircuitState
+from core.metrics import metrics
+from core.single_flight import SingleFlight, freeze_query
 
 logger = logging.getLogger(__name__)
 
 
-class Response(BaseModel):
-    status_code: int
-    body: dict | list | None = None
+class Response:
+    # Raw body is kept as bytes, the service decodes it straight into the target schema
+    __slots__ = ('status_code', 'content')
+
+    def __init__(self, status_code: int, content: bytes = b'') -> None:
+        self.status_code = status_code
+        self.content = content
 
     def ok(self) -> bool:
         return self.status_code in (200, 201)
@@ -21,15 +32,179 @@ class Method:
     PATCH = 'PATCH'
     DELETE = 'DELETE'
 
+    IDEMPOTENT = (GET, DELETE)
+
+
+@dataclass
+class PoolConfig:
+    limit: int = 100
+    limit_per_host: int = 30
+    keepalive_timeout: float = 30.0
+    dns_cache_ttl: int = 300
+
+
+@dataclass
+class RetryPolicy:
+    timeout: float = 10.0
+    attempts: int = 3
+    backoff_base: float = 0.2
+    backoff_max: float = 2.0
+    retryable_statuses: tuple[int, ...] = (502, 503, 504)
+    # Deadline for the whole call including retries, matched by endpoint prefix
+    endpoint_timeouts: dict[str, float] = field(default_factory=lambda: {
+        'v1/notifications/all': 30.0,
+        'v1/health-check': 5.0,
+    })
+
+    def timeout_for(self, endpoint: str) -> float:
+        for prefix, timeout in self.endpoint_timeouts.items():
+            if endpoint.startswith(prefix):
+                return timeout
+        return self.timeout
+
+    def backoff(self, attempt: int) -> float:
+        # Full jitter: spreads retries of many callers over the whole backoff window
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+
+@dataclass
+class PoolStats:
+    in_use: int = 0
+    idle: int = 0
+    waiting: int = 0
+
 
 class Requester:
-    def __init__(self, base_url: str):
+    def __init__(self,
+                 base_url: str,
+                 pool_config: PoolConfig | None = None,
+                 retry_policy: RetryPolicy | None = None,
+                 circuit_breaker: CircuitBreaker | None = None,
+                 ):
         self.__base_url = base_url
         self.__base_headers = {
             'Content-Type': 'application/json',
         }
+        self.__pool_config = pool_config or PoolConfig()
+        self.__session: aiohttp.ClientSession | None = None
+        self.__single_flight = SingleFlight('backend_get')
+        self.__retry_policy = retry_policy or RetryPolicy()
+        self.__circuit_breaker = circuit_breaker or CircuitBreaker('backend')
+        self.__circuit_breaker.add_listener(self.__on_circuit_state_change)
+
+        self.__retries = metrics.counter('backend_request_retries_total', 'Backend requests retried after a failure')
+        self.__timeouts = metrics.counter('backend_request_timeouts_total', 'Backend request attempts that hit the deadline')
+
+        metrics.gauge('backend_pool_connections_in_use', 'Backend connections currently serving a request',
+                      callback=lambda: self.pool_stats().in_use)
+        metrics.gauge('backend_pool_connections_idle', 'Backend keep-alive connections waiting for reuse',
+                      callback=lambda: self.pool_stats().idle)
+        metrics.gauge('backend_pool_requests_waiting', 'Requests waiting for a free backend connection',
+                      callback=lambda: self.pool_stats().waiting)
+
+    async def startup(self) -> None:
+        if self.__session is not None and not self.__session.closed:
+            return
+
+        connector = aiohttp.TCPConnector(
+            limit=self.__pool_config.limit,
+            limit_per_host=self.__pool_config.limit_per_host,
+            keepalive_timeout=self.__pool_config.keepalive_timeout,
+            ttl_dns_cache=self.__pool_config.dns_cache_ttl,
+        )
+        self.__session = aiohttp.ClientSession(connector=connector, headers=self.__base_headers)
+        logger.info(f"{self.__class__.__name__}: session started with {self.__pool_config}")
+
+    async def shutdown(self) -> None:
+        if self.__session is None:
+            return
+
+        await self.__session.close()
+        self.__session = None
+        logger.info(f"{self.__class__.__name__}: session closed")
+
+    def pool_stats(self) -> PoolStats:
+        if self.__session is None or self.__session.closed:
+            return PoolStats()
+
+        # aiohttp does not expose pool usage publicly, read it from the connector internals
+        connector = self.__session.connector
+        return PoolStats(
+            in_use=len(getattr(connector, '_acquired', ())),
+            idle=sum(len(c) for c in getattr(connector, '_conns', {}).values()),
+            waiting=sum(len(w) for w in getattr(connector, '_waiters', {}).values()),
+        )
+
+    @property
+    def coalesced_requests(self) -> int:
+        return self.__single_flight.coalesced
+
+    @property
+    def circuit_breaker(self) -> CircuitBreaker:
+        return self.__circuit_breaker
 
     async def _request(self, method: str, endpoint: str, query: dict[str, Any] = None, body: dict[str, Any] = None) -> Response:
+        if method == Method.GET:
+            return await self.__single_flight.do(
+                (method, endpoint, freeze_query(query)),
+                lambda: self.__send(method, endpoint, query, body),
+            )
+
+        return await self.__send(method, endpoint, query, body)
+
+    async def __send(self, method: str, endpoint: str, query: dict[str, Any] = None, body: dict[str, Any] = None) -> Response:
+        policy = self.__retry_policy
+        deadline = time.monotonic() + policy.timeout_for(endpoint)
+        attempts = policy.attempts if method in Method.IDEMPOTENT else 1
+
+        # The breaker sees one outcome per call, not one per attempt
+        if not self.__circuit_breaker.allow_request():
+            raise CircuitOpenError(f"{self.__class__.__name__}: backend circuit is open, {method} {endpoint} rejected")
+
+        attempt = 0
+        while True:
+            attempt += 1
+
+            try:
+                # Every attempt may use what is left of the deadline: slow endpoints keep their full timeout,
+                # quick failures still leave room for retries
+                async with asyncio.timeout(deadline - time.monotonic()):
+                    response = await self.__send_once(method, endpoint, query, body)
+            except asyncio.CancelledError:
+                self.__circuit_breaker.release()
+                raise
+            except (aiohttp.ClientError, TimeoutError) as e:
+                if isinstance(e, TimeoutError):
+                    self.__timeouts.inc()
+
+                delay = policy.backoff(attempt)
+                if attempt >= attempts or time.monotonic() + delay >= deadline:
+                    self.__circuit_breaker.record_failure()
+                    raise
+                logger.warning(f"{self.__class__.__name__}: {method} {endpoint} attempt {attempt} failed: {e.__class__.__name__}:{e}")
+            else:
+                if response.status_code not in policy.retryable_statuses:
+                    # A backend answering 5xx is failing even when retrying would not help
+                    if response.status_code >= 500:
+                        self.__circuit_breaker.record_failure()
+                    else:
+                        self.__circuit_breaker.record_success()
+                    return response
+
+                delay = policy.backoff(attempt)
+                if attempt >= attempts or time.monotonic() + delay >= deadline:
+                    self.__circuit_breaker.record_failure()
+                    return response
+                logger.warning(f"{self.__class__.__name__}: {method} {endpoint} attempt {attempt} got {response.status_code}")
+
+            self.__retries.inc()
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.__circuit_breaker.release()
+                raise
+
+    async def __send_once(self, method: str, endpoint: str, query: dict[str, Any] = None, body: dict[str, Any] = None) -> Response:
         kwargs = {}
 
         if query is not None:
@@ -38,14 +213,25 @@ class Requester:
         if body is not None:
             kwargs['json'] = body
 
-        kwargs['headers'] = self.__base_headers
-
-        async with aiohttp.ClientSession() as session:
-            async with session.request(method=method, url=f"{self.__base_url}/{endpoint}", **kwargs) as response:
-                return Response(
-                    status_code=response.status,
-                    body=await response.json(),
-                )
+        session = await self.__get_session()
+
+        async with session.request(method=method, url=f"{self.__base_url}/{endpoint}", **kwargs) as response:
+            return Response(
+                status_code=response.status,
+                content=await response.read(),
+            )
+
+    def __on_circuit_state_change(self, old_state: CircuitState, new_state: CircuitState) -> None:
+        if new_state == CircuitState.open:
+            logger.error(f"{self.__class__.__name__}: backend circuit {old_state} -> {new_state}, failing fast")
+        else:
+            logger.warning(f"{self.__class__.__name__}: backend circuit {old_state} -> {new_state}")
+
+    async def __get_session(self) -> aiohttp.ClientSession:
+        if self.__session is None or self.__session.closed:
+            logger.warning(f"{self.__class__.__name__}: session requested before startup, starting it lazily")
+            await self.startup()
+        return self.__session
 
     async def get(self, endpoint: str, query: dict[str, Any] = None) -> Response:
         return await self._request(Method.GET, endpoint, query)
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any, TypeVar
+
+from core.metrics import metrics
+
+
+T = TypeVar('T')
+
+
+class _Call:
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task: asyncio.Future) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one in-flight call.
+    Every awaiter gets the same result or exception. Cancelling one awaiter
+    does not cancel the shared call unless no awaiters are left.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.__calls: dict[Hashable, _Call] = {}
+        self.__coalesced = metrics.counter(
+            'single_flight_coalesced_total', 'Calls that joined an identical call already in flight', {'group': name},
+        )
+
+    @property
+    def coalesced(self) -> int:
+        return int(self.__coalesced.value)
+
+    def in_flight(self) -> int:
+        return len(self.__calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        call = self.__calls.get(key)
+
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self.__calls[key] = call
+            call.task.add_done_callback(lambda _: self.__forget(key, call))
+        else:
+            self.__coalesced.inc()
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Forget it right away, a caller arriving before the task has wound down starts a new call
+                self.__forget(key, call)
+                call.task.cancel()
+
+    def __forget(self, key: Hashable, call: _Call) -> None:
+        if self.__calls.get(key) is call:
+            del self.__calls[key]
+
+
+def freeze_query(query: dict[str, Any] | None) -> tuple:
+    if not query:
+        return ()
+    return tuple(sorted((k, str(v)) for k, v in query.items()))
@@ -1,24 +1,156 @@
-from datetime import datetime, time, date
+from __future__ import annotations
+
+import bisect
+import time as time_module
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import datetime, time, date, timezone
 from zoneinfo import ZoneInfo
 
 
-DUMMY_DATE = date(1990, 4, 7)
+SECONDS_PER_DAY = 24 * 60 * 60
 
 
-def utc_to_local(utc_time: time, tz: str) -> time:
-    global DUMMY_DATE
+@dataclass(slots=True)
+class _OffsetTable:
+    start: int
+    end: int
+    # Instants where the offset changes, offsets[i] applies before transitions[i]
+    transitions: list[int]
+    offsets: list[int]
+
+    def covers(self, instant: float) -> bool:
+        return self.start <= instant < self.end
+
+
+class TimezoneService:
+    """
+    UTC offsets of IANA zones from tables precomputed per zone: the offsets and DST
+    transitions from a day ago to TABLE_DAYS ahead. Lookups inside the table are a
+    search over the few transitions it holds, instants outside are computed directly.
+    """
+    TABLE_DAYS = 60
+    # Zones never change their offset twice within this step
+    SCAN_STEP_SECONDS = 6 * 60 * 60
+
+    def __init__(self) -> None:
+        self.__zones: dict[str, ZoneInfo] = {}
+        self.__tables: dict[str, _OffsetTable] = {}
+
+    def zone(self, name: str | None) -> ZoneInfo:
+        """Cached ZoneInfo, users without a timezone get UTC."""
+        name = name or 'UTC'
+        zone = self.__zones.get(name)
+        if zone is None:
+            zone = self.__zones[name] = ZoneInfo(name)
+        return zone
+
+    def offset(self, name: str | None, at: float | None = None) -> int:
+        """UTC offset in seconds at unix time `at`, now by default."""
+        now = time_module.time()
+        if at is None:
+            at = now
+        # Inlined table checks: this runs for every formatted reminder
+        table = self.__tables.get(name or 'UTC')
+        if table is None or not table.start <= now < table.end:
+            table = self.__table(name or 'UTC', now)
+        if table.start <= at < table.end:
+            transitions = table.transitions
+            return table.offsets[bisect.bisect_right(transitions, at) if transitions else 0]
+        return self.__direct_offset(self.zone(name), at)
+
+    def today(self, name: str | None) -> date:
+        now = time_module.time()
+        return datetime.fromtimestamp(now + self.offset(name, now), timezone.utc).date()
+
+    def local_seconds(self, name: str | None, utc_seconds: int, day: date | None = None) -> int:
+        """Local seconds of the day for UTC seconds of the day `utc_seconds` on UTC date `day`, today by default."""
+        midnight = self.__utc_midnight(day)
+        return (utc_seconds + self.offset(name, midnight + utc_seconds)) % SECONDS_PER_DAY
+
+    def local_time(self, name: str | None, utc_seconds: int, day: date | None = None) -> time:
+        return _time_of_day(self.local_seconds(name, utc_seconds, day))
+
+    def local_times(self, name: str | None, utc_seconds: Iterable[int], day: date | None = None) -> list[time]:
+        """local_time() for many values of one zone, the offsets of the day are looked up once."""
+        midnight = self.__utc_midnight(day)
+        table = self.__table(name or 'UTC', time_module.time())
+        if not (table.covers(midnight) and table.covers(midnight + SECONDS_PER_DAY - 1)):
+            return [self.local_time(name, s, day) for s in utc_seconds]
+
+        # A day holds at most a couple of transitions, resolve them into day-relative bounds
+        first = bisect.bisect_right(table.transitions, midnight)
+        last = bisect.bisect_right(table.transitions, midnight + SECONDS_PER_DAY - 1)
+        bounds = [t - midnight for t in table.transitions[first:last]]
+        offsets = table.offsets[first:last + 1]
+        if not bounds:
+            offset = offsets[0]
+            return [_time_of_day((s + offset) % SECONDS_PER_DAY) for s in utc_seconds]
+        return [
+            _time_of_day((s + offsets[bisect.bisect_right(bounds, s)]) % SECONDS_PER_DAY)
+            for s in utc_seconds
+        ]
 
-    utc_datetime = datetime.combine(DUMMY_DATE, utc_time, tzinfo=ZoneInfo("UTC"))
-    local_datetime = utc_datetime.astimezone(ZoneInfo(tz))
+    def __table(self, name: str, now: float) -> _OffsetTable:
+        table = self.__tables.get(name)
+        if table is None or not table.covers(now):
+            table = self.__tables[name] = self.__build_table(self.zone(name), int(now))
+        return table
+
+    def __build_table(self, zone: ZoneInfo, now: int) -> _OffsetTable:
+        start = now - SECONDS_PER_DAY
+        end = now + self.TABLE_DAYS * SECONDS_PER_DAY
+        transitions = []
+        offsets = [self.__direct_offset(zone, start)]
+
+        t = start
+        while t < end:
+            step_end = min(t + self.SCAN_STEP_SECONDS, end)
+            offset = self.__direct_offset(zone, step_end)
+            if offset != offsets[-1]:
+                # The change happened in (t, step_end], narrow it down to the second
+                low, high = t, step_end
+                while high - low > 1:
+                    middle = (low + high) // 2
+                    if self.__direct_offset(zone, middle) == offsets[-1]:
+                        low = middle
+                    else:
+                        high = middle
+                transitions.append(high)
+                offsets.append(offset)
+            t = step_end
+
+        return _OffsetTable(start, end, transitions, offsets)
+
+    @staticmethod
+    def __direct_offset(zone: ZoneInfo, at: float) -> int:
+        return int(datetime.fromtimestamp(at, zone).utcoffset().total_seconds())
+
+    @staticmethod
+    def __utc_midnight(day: date | None) -> int:
+        if day is None:
+            return int(time_module.time()) // SECONDS_PER_DAY * SECONDS_PER_DAY
+        return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
+
+
+def _time_of_day(seconds: int) -> time:
+    return time(seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+
+timezones = TimezoneService()
+
+
+def utc_to_local(utc_time: time, tz: str) -> time:
+    # The offset of today, a fixed date would apply its own DST state all year round
+    utc_datetime = datetime.combine(datetime.now(timezone.utc).date(), utc_time, tzinfo=timezone.utc)
+    local_datetime = utc_datetime.astimezone(timezones.zone(tz))
 
     return local_datetime.time()
 
 
 def local_to_utc(local_time: time, tz: str) -> time:
-    global DUMMY_DATE
-
-    local_datetime = datetime.combine(DUMMY_DATE, local_time, tzinfo=ZoneInfo(tz))
-    utc_datetime = local_datetime.astimezone(ZoneInfo("UTC"))
+    local_datetime = datetime.combine(timezones.today(tz), local_time, tzinfo=timezones.zone(tz))
+    utc_datetime = local_datetime.astimezone(timezone.utc)
 
     return utc_datetime.time()
 
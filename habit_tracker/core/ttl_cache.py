@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from collections.abc import Hashable, Iterable
+from typing import Any
+
+from core.metrics import metrics
+
+
+class TTLCache:
+    """
+    LRU cache with per-entry expiry. Entries can be tagged so that a group
+    of keys (e.g. everything belonging to one user) is invalidated at once.
+    """
+    MISSING = object()
+
+    def __init__(self, name: str, ttl_seconds: float, max_entries: int) -> None:
+        self.__ttl_seconds = ttl_seconds
+        self.__max_entries = max_entries
+        self.__entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.__tags_by_key: dict[Hashable, tuple[Hashable, ...]] = {}
+        self.__keys_by_tag: dict[Hashable, set[Hashable]] = {}
+
+        self.__hits = metrics.counter('cache_hits_total', 'Cache lookups served from memory', {'cache': name})
+        self.__misses = metrics.counter('cache_misses_total', 'Cache lookups that missed or expired', {'cache': name})
+        self.__evictions = metrics.counter('cache_evictions_total', 'Entries evicted by the LRU bound', {'cache': name})
+        metrics.gauge('cache_entries', 'Entries currently held in the cache', {'cache': name}, callback=self.__len__)
+
+    @property
+    def hits(self) -> int:
+        return int(self.__hits.value)
+
+    @property
+    def misses(self) -> int:
+        return int(self.__misses.value)
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        entry = self.__entries.get(key)
+
+        if entry is None:
+            self.__misses.inc()
+            return default
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self.__remove(key)
+            self.__misses.inc()
+            return default
+
+        self.__entries.move_to_end(key)
+        self.__hits.inc()
+        return value
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[Hashable] = (), ttl_seconds: float | None = None) -> None:
+        if key in self.__entries:
+            self.__remove(key)
+
+        ttl_seconds = self.__ttl_seconds if ttl_seconds is None else ttl_seconds
+        self.__entries[key] = (time.monotonic() + ttl_seconds, value)
+
+        tags = tuple(tags)
+        if tags:
+            self.__tags_by_key[key] = tags
+            for tag in tags:
+                self.__keys_by_tag.setdefault(tag, set()).add(key)
+
+        while len(self.__entries) > self.__max_entries:
+            oldest_key = next(iter(self.__entries))
+            self.__remove(oldest_key)
+            self.__evictions.inc()
+
+    def invalidate(self, key: Hashable) -> None:
+        if key in self.__entries:
+            self.__remove(key)
+
+    def invalidate_tag(self, tag: Hashable) -> int:
+        keys = self.__keys_by_tag.get(tag, ())
+        removed = 0
+
+        for key in list(keys):
+            self.__remove(key)
+            removed += 1
+        return removed
+
+    def clear(self) -> None:
+        self.__entries.clear()
+        self.__tags_by_key.clear()
+        self.__keys_by_tag.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self.__entries.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __remove(self, key: Hashable) -> None:
+        self.__entries.pop(key, None)
+
+        for tag in self.__tags_by_key.pop(key, ()):
+            keys = self.__keys_by_tag.get(tag)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if not keys:
+                del self.__keys_by_tag[tag]
@@ -1,8 +1,11 @@
 import datetime
-from zoneinfo import ZoneInfo
+
+from core.timezone_utils import SECONDS_PER_DAY, timezones
 
 
 def seconds_to_time(seconds: int) -> datetime.time:
+    # Seconds shifted by a timezone offset may fall on the previous or next day
+    seconds %= SECONDS_PER_DAY
     return datetime.time(
         hour=seconds // 3600,
         minute=(seconds % 3600) // 60,
@@ -19,4 +22,4 @@ def datetime_to_seconds(dt: datetime.datetime) -> int:
 
 
 def timezone_offset(tz_name: str) -> datetime.timedelta:
-    return datetime.datetime.now(ZoneInfo(tz_name)).utcoffset()
+    return datetime.timedelta(seconds=timezones.offset(tz_name))
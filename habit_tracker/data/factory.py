@@ -1,12 +1,61 @@
 import config
 
-from core.requester import Requester
+from core.circuit_breaker import CircuitBreaker
+from core.requester import Requester, PoolConfig, RetryPolicy
 from data.repositories.backend_repository.backend_repository import BackendRepository
+from data.repositories.backend_repository.caching_backend_repository import CachingBackendRepository
 from data.services.backend_service.backend_service import BackendService
 
 
+requester: Requester | None = None
+backend_repository: BackendRepository | None = None
+
+
+async def setup_backend_repository() -> BackendRepository:
+    global requester, backend_repository
+
+    if backend_repository is not None:
+        return backend_repository
+
+    requester = Requester(
+        config.BACKEND_URL,
+        PoolConfig(
+            limit=config.BACKEND_POOL_LIMIT,
+            limit_per_host=config.BACKEND_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=config.BACKEND_POOL_KEEPALIVE_TIMEOUT,
+            dns_cache_ttl=config.BACKEND_POOL_DNS_CACHE_TTL,
+        ),
+        RetryPolicy(
+            timeout=config.BACKEND_REQUEST_TIMEOUT,
+            attempts=config.BACKEND_REQUEST_ATTEMPTS,
+        ),
+        CircuitBreaker(
+            'backend',
+            failure_threshold=config.BACKEND_CIRCUIT_FAILURE_THRESHOLD,
+            recovery_timeout=config.BACKEND_CIRCUIT_RECOVERY_SECONDS,
+        ),
+    )
+    await requester.startup()
+
+    backend_repository = CachingBackendRepository(
+        BackendRepository(BackendService(requester)),
+        ttl_seconds=config.BACKEND_CACHE_TTL_SECONDS,
+        max_entries=config.BACKEND_CACHE_MAX_ENTRIES,
+        negative_ttl_seconds=config.BACKEND_CACHE_NEGATIVE_TTL_SECONDS,
+    )
+    return backend_repository
+
+
+async def close_backend_repository() -> None:
+    global requester, backend_repository
+
+    if requester is not None:
+        await requester.shutdown()
+
+    requester = None
+    backend_repository = None
+
+
 def get_backend_repository() -> BackendRepository:
-    requester = Requester(config.BACKEND_URL)
-    service = BackendService(requester)
-    repository = BackendRepository(service)
-    return repository
+    assert backend_repository is not None, 'setup_backend_repository() must be awaited before get_backend_repository()'
+    return backend_repository
@@ -1,4 +1,8 @@
+import asyncio
+import logging
+from collections.abc import Callable, Iterable
 from datetime import date, datetime
+from enum import StrEnum, auto
 
 from data.services.backend_service.backend_service import BackendService
 from data.schemas import (
@@ -12,12 +16,37 @@ from data.schemas import (
     HabitProgress,
     HabitStatistics,
     Notification, NotificationBase,
+    NotificationBatch,
 )
 
 
+logger = logging.getLogger(__name__)
+
+
+class HabitChange(StrEnum):
+    created = auto()
+    updated = auto()
+    deleted = auto()
+
+
+# listener(change, habit_id, owner user_id or None when unknown), called after a habit or its notifications changed
+HabitListener = Callable[[HabitChange, int, int | None], None]
+
+
 class BackendRepository:
     def __init__(self, backend_service: BackendService) -> None:
         self._service = backend_service
+        self._listeners: list[HabitListener] = []
+
+    def subscribe(self, listener: HabitListener) -> None:
+        self._listeners.append(listener)
+
+    def _publish(self, change: HabitChange, habit_id: int, user_id: int | None = None) -> None:
+        for listener in self._listeners:
+            try:
+                listener(change, habit_id, user_id)
+            except Exception as e:
+                logger.exception(e)
 
     async def get_user_info(self, telegram_id: int) -> User | None:
         return await self._service.get_user_by_telegram(telegram_id)
@@ -35,7 +64,29 @@ class BackendRepository:
         return await self._service.get_habit_by_user_id_and_name(user_id, habit_name)
 
     async def create_habit(self, user_id: int, habit_buffer: HabitBuffer) -> Habit | None:
-        return await self._service.create_habit(user_id, habit_buffer)
+        habit = await self._service.create_habit(user_id, habit_buffer)
+        if habit is not None:
+            self._publish(HabitChange.created, habit.id, user_id)
+        return habit
+
+    async def get_habits(self, user_id: int) -> list[Habit] | None:
+        return await self._service.get_habits(user_id)
+
+    async def get_habits_by_ids(self, user_id: int, habit_ids: Iterable[int]) -> dict[int, Habit]:
+        habit_ids = set(habit_ids)
+        if not habit_ids:
+            return {}
+
+        habits = await self.get_habits(user_id)
+        if habits is not None:
+            return {h.id: h for h in habits if h.id in habit_ids}
+
+        # bulk listing failed, fall back to one lookup per distinct habit
+        habits = await asyncio.gather(*[
+            self.get_habit_by_user_id_and_id(user_id, habit_id)
+            for habit_id in habit_ids
+        ])
+        return {h.id: h for h in habits if h is not None}
 
     async def get_habits_for_date(self, user_id: int, habit_date: date, unfinished_only: bool = False) -> list[HabitProgress] | None:
         return await self._service.get_habits_for_date(user_id, habit_date, unfinished_only)
@@ -47,7 +98,10 @@ class BackendRepository:
         return await self._service.get_habit_by_user_id_and_id(user_id, habit_id)
 
     async def update_habit(self, habit: HabitUpdate, notifications: list[NotificationBase] | None = None) -> Habit | None:
-        return await self._service.update_habit(habit, notifications)
+        updated_habit = await self._service.update_habit(habit, notifications)
+        if updated_habit is not None:
+            self._publish(HabitChange.updated, habit.id, habit.user_id)
+        return updated_habit
 
     async def get_habit_statistics(self, user_id: int, habit_id: int, target_date: date) -> HabitStatistics:
         return await self._service.get_habit_statistics(user_id, habit_id, target_date)
@@ -56,11 +110,15 @@ class BackendRepository:
         return await self._service.get_all_habits_statistics(user_id, today)
 
     async def delete_habit(self, user_id: int, habit_id: int) -> None:
-        return await self._service.delete_habit(user_id, habit_id)
+        await self._service.delete_habit(user_id, habit_id)
+        self._publish(HabitChange.deleted, habit_id, user_id)
 
     async def get_notifications_for_period(self, now: datetime, period: int) -> list[Notification]:
         return await self._service.get_notifications_for_period(now, period)
 
+    async def get_notification_batch_for_period(self, now: datetime, period: int) -> NotificationBatch | None:
+        return await self._service.get_notification_batch_for_period(now, period)
+
     async def get_todays_notifications(self, user_id: int, today: date) -> list[Notification] | None:
         return await self._service.get_todays_notifications(user_id, today)
     
@@ -68,7 +126,10 @@ class BackendRepository:
         return await self._service.get_habit_notifications(habit_id)
 
     async def create_notification(self, habit_id: int, time_in_seconds: int | None = None) -> Notification | None:
-        return await self._service.create_notification(habit_id, time_in_seconds)
+        notification = await self._service.create_notification(habit_id, time_in_seconds)
+        if notification is not None:
+            self._publish(HabitChange.updated, habit_id)
+        return notification
 
     async def health_check(self) -> bool:
         return await self._service.health_check()
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import copy
+from collections.abc import Awaitable, Callable, Hashable, Iterable
+from datetime import date, datetime
+from typing import Any
+
+from core.ttl_cache import TTLCache
+from data.repositories.backend_repository.backend_repository import BackendRepository, HabitListener
+from data.schemas import (
+    User,
+    Habit,
+    HabitBuffer,
+    HabitEvent,
+    HabitUpdate,
+    CommonProgress,
+    UserUpdate,
+    HabitProgress,
+    HabitStatistics,
+    Notification, NotificationBase,
+    NotificationBatch,
+)
+
+
+def _user_tag(user_id: int) -> tuple:
+    return 'user', user_id
+
+
+def _telegram_tag(telegram_id: int) -> tuple:
+    return 'telegram', telegram_id
+
+
+def _habit_tag(habit_id: int) -> tuple:
+    return 'habit', habit_id
+
+
+def _habits_tag(user_id: int) -> tuple:
+    return 'habits', user_id
+
+
+def _progress_tag(user_id: int | None = None) -> tuple:
+    # Progress of every user is additionally tagged with ('progress',) so it can be dropped wholesale
+    return ('progress',) if user_id is None else ('progress', user_id)
+
+
+class CachingBackendRepository(BackendRepository):
+    """
+    Read-through cache in front of a BackendRepository. Reads are cached per user
+    with TTL and LRU eviction, mutations invalidate exactly the entries they affect.
+    Cached models are copied on the way in and out because states mutate them.
+    """
+    OWNERS_TTL_SECONDS = 24 * 60 * 60
+    # Stored for lookups that found nothing, so unknown users do not hit the backend on every update
+    NOT_FOUND = object()
+
+    def __init__(self,
+                 repository: BackendRepository,
+                 ttl_seconds: float,
+                 max_entries: int,
+                 negative_ttl_seconds: float = 0,
+                 ) -> None:
+        super().__init__(repository._service)
+        self._repository = repository
+        self._negative_ttl_seconds = negative_ttl_seconds
+        self._cache = TTLCache('backend', ttl_seconds, max_entries)
+        # habit_id / notification_id -> backend user id, used to invalidate by owner
+        self._owners = TTLCache('backend_owners', self.OWNERS_TTL_SECONDS, max_entries)
+
+    @property
+    def cache(self) -> TTLCache:
+        return self._cache
+
+    def subscribe(self, listener: HabitListener) -> None:
+        # Mutations are published by the wrapped repository
+        self._repository.subscribe(listener)
+
+    async def get_user_info(self, telegram_id: int) -> User | None:
+        async def fetch() -> User | None:
+            return await self._repository.get_user_info(telegram_id)
+
+        def tags(user: User | None) -> tuple:
+            if user is None:
+                return (_telegram_tag(telegram_id),)
+            return _telegram_tag(telegram_id), _user_tag(user.id)
+
+        # register_user_by_telegram drops the negative entry through the telegram tag
+        return await self.__cached(('get_user_info', telegram_id), fetch, tags, negative_ttl_seconds=self._negative_ttl_seconds)
+
+    async def get_user(self, user_id: int) -> User | None:
+        return await self._repository.get_user(user_id)
+
+    async def register_user_by_telegram(self, user_name: str, telegram_id: int) -> User | None:
+        user = await self._repository.register_user_by_telegram(user_name, telegram_id)
+        self._cache.invalidate_tag(_telegram_tag(telegram_id))
+        return user
+
+    async def update_user(self, user: UserUpdate) -> User | None:
+        updated_user = await self._repository.update_user(user)
+        self._cache.invalidate_tag(_user_tag(user.id))
+        return updated_user
+
+    async def get_habit_by_user_id_and_name(self, user_id: int, habit_name: str) -> Habit | None:
+        return await self._repository.get_habit_by_user_id_and_name(user_id, habit_name)
+
+    async def create_habit(self, user_id: int, habit_buffer: HabitBuffer) -> Habit | None:
+        habit = await self._repository.create_habit(user_id, habit_buffer)
+        if habit is not None:
+            self._owners.set(_habit_tag(habit.id), user_id)
+        self.__invalidate_user_habits(user_id)
+        return habit
+
+    async def get_habits(self, user_id: int) -> list[Habit] | None:
+        async def fetch() -> list[Habit] | None:
+            habits = await self._repository.get_habits(user_id)
+            for habit in habits or ():
+                self._owners.set(_habit_tag(habit.id), user_id)
+            return habits
+
+        return await self.__cached(
+            ('get_habits', user_id),
+            fetch,
+            lambda habits: (_habits_tag(user_id), *(_habit_tag(h.id) for h in habits)),
+        )
+
+    # get_habits_by_ids is inherited: it goes through the cached get_habits and
+    # get_habit_by_user_id_and_id of this class
+
+    async def get_habits_for_date(self, user_id: int, habit_date: date, unfinished_only: bool = False) -> list[HabitProgress] | None:
+        async def fetch() -> list[HabitProgress] | None:
+            habits = await self._repository.get_habits_for_date(user_id, habit_date, unfinished_only)
+            for habit in habits or ():
+                self._owners.set(_habit_tag(habit.id), user_id)
+            return habits
+
+        return await self.__cached(
+            ('get_habits_for_date', user_id, habit_date, unfinished_only),
+            fetch,
+            lambda _: (_habits_tag(user_id), _progress_tag(user_id), _progress_tag()),
+        )
+
+    async def send_habit_event(self, notification_id: int, timestamp: datetime) -> HabitEvent:
+        event = await self._repository.send_habit_event(notification_id, timestamp)
+
+        user_id = self._owners.get(('notification', notification_id), None)
+        self._cache.invalidate_tag(_progress_tag(user_id))
+        return event
+
+    async def get_habit_by_user_id_and_id(self, user_id: int, habit_id: int) -> Habit | None:
+        async def fetch() -> Habit | None:
+            habit = await self._repository.get_habit_by_user_id_and_id(user_id, habit_id)
+            if habit is not None:
+                self._owners.set(_habit_tag(habit_id), user_id)
+            return habit
+
+        return await self.__cached(
+            ('get_habit_by_user_id_and_id', user_id, habit_id),
+            fetch,
+            lambda _: (_habit_tag(habit_id), _habits_tag(user_id)),
+        )
+
+    async def update_habit(self, habit: HabitUpdate, notifications: list[NotificationBase] | None = None) -> Habit | None:
+        updated_habit = await self._repository.update_habit(habit, notifications)
+        self._cache.invalidate_tag(_habit_tag(habit.id))
+        self.__invalidate_user_habits(habit.user_id)
+        return updated_habit
+
+    async def get_habit_statistics(self, user_id: int, habit_id: int, target_date: date) -> HabitStatistics:
+        return await self.__cached(
+            ('get_habit_statistics', user_id, habit_id, target_date),
+            lambda: self._repository.get_habit_statistics(user_id, habit_id, target_date),
+            lambda _: (_habit_tag(habit_id), _progress_tag(user_id), _progress_tag()),
+        )
+
+    async def get_all_habits_statistics(self, user_id: int, today: date) -> CommonProgress | None:
+        return await self.__cached(
+            ('get_all_habits_statistics', user_id, today),
+            lambda: self._repository.get_all_habits_statistics(user_id, today),
+            lambda _: (_progress_tag(user_id), _progress_tag()),
+        )
+
+    async def delete_habit(self, user_id: int, habit_id: int) -> None:
+        await self._repository.delete_habit(user_id, habit_id)
+        self._cache.invalidate_tag(_habit_tag(habit_id))
+        self.__invalidate_user_habits(user_id)
+
+    async def get_notifications_for_period(self, now: datetime, period: int) -> list[Notification]:
+        return await self._repository.get_notifications_for_period(now, period)
+
+    async def get_notification_batch_for_period(self, now: datetime, period: int) -> NotificationBatch | None:
+        return await self._repository.get_notification_batch_for_period(now, period)
+
+    async def get_todays_notifications(self, user_id: int, today: date) -> list[Notification] | None:
+        notifications = await self._repository.get_todays_notifications(user_id, today)
+        self.__remember_notification_owners(notifications or (), user_id)
+        return notifications
+
+    async def get_habit_notifications(self, habit_id: int) -> list[Notification] | None:
+        async def fetch() -> list[Notification] | None:
+            notifications = await self._repository.get_habit_notifications(habit_id)
+            user_id = self._owners.get(_habit_tag(habit_id), None)
+            if user_id is not None:
+                self.__remember_notification_owners(notifications or (), user_id)
+            return notifications
+
+        return await self.__cached(
+            ('get_habit_notifications', habit_id),
+            fetch,
+            lambda _: (_habit_tag(habit_id),),
+        )
+
+    async def create_notification(self, habit_id: int, time_in_seconds: int | None = None) -> Notification | None:
+        notification = await self._repository.create_notification(habit_id, time_in_seconds)
+        self._cache.invalidate_tag(_habit_tag(habit_id))
+
+        user_id = self._owners.get(_habit_tag(habit_id), None)
+        if user_id is not None:
+            self.__invalidate_user_habits(user_id)
+            if notification is not None and notification.notification_id is not None:
+                self._owners.set(('notification', notification.notification_id), user_id)
+        return notification
+
+    async def health_check(self) -> bool:
+        return await self._repository.health_check()
+
+    async def __cached(self,
+                       key: Hashable,
+                       fetch: Callable[[], Awaitable[Any]],
+                       tags: Callable[[Any], Iterable[Hashable]],
+                       negative_ttl_seconds: float = 0,
+                       ) -> Any:
+        value = self._cache.get(key)
+        if value is self.NOT_FOUND:
+            return None
+        if value is not TTLCache.MISSING:
+            return copy.deepcopy(value)
+
+        value = await fetch()
+        if value is not None:
+            self._cache.set(key, copy.deepcopy(value), tags(value))
+        elif negative_ttl_seconds > 0:
+            self._cache.set(key, self.NOT_FOUND, tags(None), ttl_seconds=negative_ttl_seconds)
+        return value
+
+    def __invalidate_user_habits(self, user_id: int) -> None:
+        self._cache.invalidate_tag(_habits_tag(user_id))
+        self._cache.invalidate_tag(_progress_tag(user_id))
+
+    def __remember_notification_owners(self, notifications: Iterable[Notification], user_id: int) -> None:
+        for n in notifications:
+            if n.notification_id is not None:
+                self._owners.set(('notification', n.notification_id), user_id)
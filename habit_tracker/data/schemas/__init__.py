@@ -17,6 +17,7 @@ from .habit_event import (
     CommonProgress,
 )
 from .notification import Notification, NotificationCreate, NotificationBase
+from .notification_batch import NotificationBatch
 
 
 __all__ = [
@@ -41,4 +42,5 @@ __all__ = [
     'Notification',
     'NotificationCreate',
     'NotificationBase',
+    'NotificationBatch',
 ]
@@ -1,20 +1,19 @@
-from zoneinfo import ZoneInfo
-
 from pydantic import BaseModel, ConfigDict
 from typing import Optional
-from datetime import time
+from datetime import date, time
 
-from core.utils import seconds_to_time, timezone_offset
+from core.timezone_utils import timezones
 
 
 class NotificationBase(BaseModel):
     time_in_seconds: Optional[int] = None  # 0..86399; None means unscheduled
 
-    def time(self, time_zone: str) -> time:
+    def time(self, time_zone: str, day: date | None = None) -> time:
+        """Local time in `time_zone` on UTC date `day`, today by default."""
         if self.time_in_seconds is None:
             # return midnight by default for formatting, caller should handle None separately
             return time(0, 0)
-        return seconds_to_time(self.time_in_seconds + int(timezone_offset(time_zone).total_seconds()))
+        return timezones.local_time(time_zone, self.time_in_seconds, day)
 
 
 class NotificationCreate(NotificationBase):
@@ -0,0 +1,113 @@
+"""
+Columnar form of a notification list for the notificator: one NumPy array per field
+instead of a pydantic model per row. Filtering, dedup and fire times run on whole
+columns, Notification models are built only for the rows that are sent.
+"""
+from __future__ import annotations
+
+from collections.abc import Sequence
+
+import numpy as np
+import pydantic_core
+
+from core.timezone_utils import SECONDS_PER_DAY
+from .notification import Notification
+
+# Stands for a missing id or time in the integer columns
+MISSING = -1
+
+# 'HH:MM' of every minute of the day, indexed by seconds of the day // 60
+HHMM = tuple(f'{minute // 60:02}:{minute % 60:02}' for minute in range(24 * 60))
+
+
+def format_hhmm(seconds: int) -> str:
+    """'HH:MM' for seconds of the day, shifted values outside the day wrap around."""
+    return HHMM[seconds % SECONDS_PER_DAY // 60]
+
+
+def _column(rows: Sequence[dict], field: str) -> np.ndarray:
+    return np.fromiter(
+        (MISSING if (value := row.get(field)) is None else value for row in rows),
+        dtype=np.int64,
+        count=len(rows),
+    )
+
+
+class NotificationBatch:
+    __slots__ = ('user_id', 'habit_id', 'notification_id', 'time_in_seconds', 'habit_name')
+
+    def __init__(self,
+                 user_id: np.ndarray,
+                 habit_id: np.ndarray,
+                 notification_id: np.ndarray,
+                 time_in_seconds: np.ndarray,
+                 habit_name: np.ndarray,
+                 ) -> None:
+        self.user_id = user_id
+        self.habit_id = habit_id
+        self.notification_id = notification_id
+        self.time_in_seconds = time_in_seconds
+        # object array of str | None
+        self.habit_name = habit_name
+
+    @classmethod
+    def from_json(cls, content: bytes | str) -> NotificationBatch:
+        # pydantic-core's parser, with the few repeated keys interned, is about twice as fast as json.loads here
+        rows = pydantic_core.from_json(content, cache_strings='keys')
+        names = np.empty(len(rows), dtype=object)
+        names[:] = [row.get('habit_name') for row in rows]
+        return cls(
+            _column(rows, 'user_id'),
+            _column(rows, 'habit_id'),
+            _column(rows, 'notification_id'),
+            _column(rows, 'time_in_seconds'),
+            names,
+        )
+
+    def __len__(self) -> int:
+        return len(self.habit_id)
+
+    def take(self, rows: np.ndarray) -> NotificationBatch:
+        """Batch of the rows selected by an index array or a boolean mask."""
+        return NotificationBatch(
+            self.user_id[rows],
+            self.habit_id[rows],
+            self.notification_id[rows],
+            self.time_in_seconds[rows],
+            self.habit_name[rows],
+        )
+
+    def routable(self) -> np.ndarray:
+        """Mask of rows with a user and a time, the only ones that can be scheduled."""
+        return (self.user_id != MISSING) & (self.time_in_seconds != MISSING)
+
+    def unique_rows(self) -> np.ndarray:
+        """Indexes of the first row of every (user, habit, notification, time) key, in batch order."""
+        keys = np.ascontiguousarray(
+            np.stack((self.user_id, self.habit_id, self.notification_id, self.time_in_seconds), axis=1)
+        )
+        # One 32-byte opaque value per row, so np.unique compares whole keys at once
+        _, first = np.unique(keys.view(np.dtype((np.void, keys.dtype.itemsize * 4))).ravel(), return_index=True)
+        first.sort()
+        return first
+
+    def fire_times(self, start: float) -> np.ndarray:
+        """Unix time of each row's next occurrence at or after `start`, at most a day later."""
+        midnight = int(start) // SECONDS_PER_DAY * SECONDS_PER_DAY
+        fire_at = midnight + self.time_in_seconds
+        return np.where(fire_at < start, fire_at + SECONDS_PER_DAY, fire_at)
+
+    def habits_missing_names(self) -> tuple[np.ndarray, np.ndarray]:
+        """(habit ids, their user ids) of the distinct habits whose rows came without a name."""
+        missing = np.equal(self.habit_name, None)
+        habit_ids, first = np.unique(self.habit_id[missing], return_index=True)
+        return habit_ids, self.user_id[missing][first]
+
+    def notification(self, row: int) -> Notification:
+        return Notification(
+            notification_id=None if self.notification_id[row] == MISSING else int(self.notification_id[row]),
+            habit_id=int(self.habit_id[row]),
+            user_id=None if self.user_id[row] == MISSING else int(self.user_id[row]),
+            habit_name=self.habit_name[row],
+            time_in_seconds=None if self.time_in_seconds[row] == MISSING else int(self.time_in_seconds[row]),
+        )
@@ -1,6 +1,7 @@
 from datetime import date, datetime
 
 from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
 
 from core.requester import Requester, Response
 from data.schemas import (
@@ -16,10 +17,25 @@ from data.schemas import (
     CommonProgress,
     Notification,
     NotificationCreate, NotificationBase,
+    NotificationBatch,
 )
 from data.schemas.habit import HabitProgress, HabitUpdateWithNotifications
 
 
+# Adapters are built once: responses are validated from raw bytes by pydantic-core's
+# JSON parser without an intermediate dict
+USER_ADAPTER = TypeAdapter(User)
+HABIT_ADAPTER = TypeAdapter(Habit)
+HABIT_LIST_ADAPTER = TypeAdapter(list[Habit])
+HABIT_UPDATE_ADAPTER = TypeAdapter(HabitUpdate)
+HABIT_PROGRESS_LIST_ADAPTER = TypeAdapter(list[HabitProgress])
+HABIT_EVENT_ADAPTER = TypeAdapter(HabitEvent)
+HABIT_STATISTICS_ADAPTER = TypeAdapter(HabitStatistics)
+COMMON_PROGRESS_ADAPTER = TypeAdapter(CommonProgress)
+NOTIFICATION_ADAPTER = TypeAdapter(Notification)
+NOTIFICATION_LIST_ADAPTER = TypeAdapter(list[Notification])
+
+
 class BackendService:
     def __init__(self, requester: Requester) -> None:
         self._requester: Requester = requester
@@ -33,7 +49,7 @@ class BackendService:
         if not r.ok():
             return
 
-        return User(**r.body)
+        return USER_ADAPTER.validate_json(r.content)
 
     async def get_user(self, user_id: int) -> User | None:
         r: Response = await self._requester.get(
@@ -44,7 +60,7 @@ class BackendService:
         if not r.ok():
             return
 
-        return User(**r.body)
+        return USER_ADAPTER.validate_json(r.content)
 
     async def update_user(self, user: UserUpdate) -> User | None:
         r: Response = await self._requester.patch(
@@ -55,7 +71,7 @@ class BackendService:
         if not r.ok():
             return
 
-        return User(**r.body)
+        return USER_ADAPTER.validate_json(r.content)
 
     async def get_user_by_telegram(self, telegram_id: int) -> User | None:
         r: Response = await self._requester.get("v1/users/telegram", query={'telegram_id': telegram_id})
@@ -63,7 +79,7 @@ class BackendService:
         if not r.ok():
             return
 
-        return User(**r.body)
+        return USER_ADAPTER.validate_json(r.content)
 
     async def get_habit_by_user_id_and_name(self, user_id: int, habit_name: str) -> Habit | None:
         r: Response = await self._requester.get("v1/habits/habit", query={'user_id': user_id, 'habit_name': habit_name})
@@ -71,7 +87,7 @@ class BackendService:
         if not r.ok():
             return
 
-        return Habit(**r.body)
+        return HABIT_ADAPTER.validate_json(r.content)
 
     async def create_habit(self, user_id: int, habit_buffer: HabitBuffer) -> Habit | None:
         habit = HabitCreate(user_id=user_id, **habit_buffer.model_dump())
@@ -80,7 +96,15 @@ class BackendService:
         if not r.ok():
             return
 
-        return Habit(**r.body)
+        return HABIT_ADAPTER.validate_json(r.content)
+
+    async def get_habits(self, user_id: int) -> list[Habit] | None:
+        r: Response = await self._requester.get("v1/habits", query={'user_id': user_id})
+
+        if not r.ok():
+            return
+
+        return HABIT_LIST_ADAPTER.validate_json(r.content)
 
     async def get_habits_for_date(self, user_id: int, habit_date: date, unfinished_only: bool = False) -> list[HabitProgress] | None:
         r: Response = await self._requester.get(
@@ -91,7 +115,7 @@ class BackendService:
         if not r.ok():
             return
 
-        return [HabitProgress(**h) for h in r.body]
+        return HABIT_PROGRESS_LIST_ADAPTER.validate_json(r.content)
 
     async def send_habit_event(self, notification_id: int, timestamp: datetime) -> HabitEvent | None:
         r: Response = await self._requester.post(
@@ -102,7 +126,7 @@ class BackendService:
         if not r.ok():
             return
 
-        return HabitEvent(**r.body)
+        return HABIT_EVENT_ADAPTER.validate_json(r.content)
 
     async def get_habit_by_user_id_and_id(self, user_id: int, habit_id: int) -> Habit | None:
         r: Response = await self._requester.get(f"v1/habits/{habit_id}", query={'user_id': user_id})
@@ -110,7 +134,7 @@ class BackendService:
         if not r.ok():
             return
 
-        return HabitUpdate(**r.body)
+        return HABIT_UPDATE_ADAPTER.validate_json(r.content)
 
     async def update_habit(self, habit: HabitUpdate, notifications: list[NotificationBase] | None = None) -> Habit | None:
         body = habit.model_dump()
@@ -125,7 +149,7 @@ class BackendService:
         if not r.ok():
             return
 
-        return Habit(**r.body)
+        return HABIT_ADAPTER.validate_json(r.content)
 
     async def get_habit_statistics(self, user_id: int, habit_id: int, target_date: date) -> HabitStatistics | None:
         r: Response = await self._requester.get(
@@ -138,7 +162,7 @@ class BackendService:
         if not r.ok():
             return
 
-        return HabitStatistics(**r.body)
+        return HABIT_STATISTICS_ADAPTER.validate_json(r.content)
 
     async def get_all_habits_statistics(self, user_id: int, today: date) -> CommonProgress | None:
         r: Response = await self._requester.get(
@@ -151,7 +175,7 @@ class BackendService:
         if not r.ok():
             return
 
-        return CommonProgress(**r.body)
+        return COMMON_PROGRESS_ADAPTER.validate_json(r.content)
 
     async def delete_habit(self, user_id: int, habit_id: int) -> None:
         r: Response = await self._requester.delete(f"v1/habits/{habit_id}", query={'user_id': user_id})
@@ -170,7 +194,18 @@ class BackendService:
         if not r.ok():
             return
 
-        return [Notification(**h) for h in r.body]
+        return NOTIFICATION_LIST_ADAPTER.validate_json(r.content)
+
+    async def get_notification_batch_for_period(self, now: datetime, period: int) -> NotificationBatch | None:
+        r: Response = await self._requester.get(
+            f"v1/notifications/all",
+            query=jsonable_encoder({'now': now, 'period': period}),
+        )
+
+        if not r.ok():
+            return
+
+        return NotificationBatch.from_json(r.content)
 
     async def get_todays_notifications(self, user_id: int, today: date) -> list[Notification] | None:
         r: Response = await self._requester.get(
@@ -181,7 +216,7 @@ class BackendService:
         if not r.ok():
             return
 
-        return [Notification(**n) for n in r.body]
+        return NOTIFICATION_LIST_ADAPTER.validate_json(r.content)
     
     async def get_habit_notifications(self, habit_id: int) -> list[Notification] | None:
         r: Response = await self._requester.get(
@@ -191,7 +226,7 @@ class BackendService:
         if not r.ok():
             return
         
-        return [Notification(**n) for n in r.body]
+        return NOTIFICATION_LIST_ADAPTER.validate_json(r.content)
 
     async def create_notification(self, habit_id: int, time_in_seconds: int | None = None) -> Notification | None:
         body = NotificationCreate(habit_id=habit_id, time_in_seconds=time_in_seconds)
@@ -203,7 +238,7 @@ class BackendService:
         if not r.ok():
             return
 
-        return Notification(**r.body)
+        return NOTIFICATION_ADAPTER.validate_json(r.content)
 
     async def health_check(self) -> bool:
         r: Response = await self._requester.get("v1/health-check")
@@ -9,6 +9,7 @@ from web.http_server import run_http
 from core.localizator.load_locales import setup_localizator
 from bot.cache import setup_cache
 from bot.messenger_queue import setup_messenger_queue
+from data.factory import setup_backend_repository, close_backend_repository
 from config import LOCALES_DIRECTORY
 
 
@@ -16,21 +17,36 @@ logger = logging.getLogger(__name__)
 
 
 async def main():
-    if not (await is_bot_ready_to_start()):
-        logger.error("Bot is not ready to start exiting.")
-        return
-
-    setup_localizator(LOCALES_DIRECTORY)
-    messenger_queue = setup_messenger_queue()
-    setup_cache(messenger_queue)
-    notificator = setup_notificator(messenger_queue)
-
-    await asyncio.gather(
-        run_http(),
-        run_bot(),
-        messenger_queue.process_messages(),
-        notificator.process_notifications(),
-    )
+    await setup_backend_repository()
+    cache = None
+    notificator = None
+
+    try:
+        if not (await is_bot_ready_to_start()):
+            logger.error("Bot is not ready to start exiting.")
+            return
+
+        setup_localizator(LOCALES_DIRECTORY)
+        messenger_queue = setup_messenger_queue()
+        cache = setup_cache(messenger_queue)
+        cache.load_snapshot()
+        notificator = setup_notificator(messenger_queue)
+        notificator.load_ledger()
+
+        await asyncio.gather(
+            run_http(),
+            run_bot(),
+            messenger_queue.process_messages(),
+            notificator.process_notifications(),
+            cache.process_eviction(),
+            cache.process_snapshots(),
+        )
+    finally:
+        if cache is not None:
+            await cache.save_snapshot()
+        if notificator is not None:
+            await notificator.save_ledger()
+        await close_backend_repository()
 
 
 if __name__ == "__main__":
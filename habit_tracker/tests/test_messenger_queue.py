@@ -0,0 +1,110 @@
+"""
+Run from the habit_tracker directory:
+    python -m pytest tests
+"""
+import os
+
+os.environ.setdefault('API_ENDPOINT_PORT', '39999')
+
+from bot import messenger_queue
+from bot.messenger import Lane
+from bot.messenger_queue import MessengerQueue
+
+# One dispatch per slot at the Telegram global limit
+DISPATCH_SECONDS = 1 / 30
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class FakeMessenger:
+    def __init__(self, telegram_id: int, lane: Lane) -> None:
+        self.telegram_id = telegram_id
+        self.lane = lane
+
+    def next_lane(self) -> Lane:
+        return self.lane
+
+    def has_pending(self) -> bool:
+        return True
+
+
+def test_interactive_is_not_held_back_by_reminder_burst(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(messenger_queue, 'time', clock)
+    queue = MessengerQueue()
+    ready = queue._MessengerQueue__on_messenger_ready
+    next_messenger = queue._MessengerQueue__next_messenger
+
+    # 20 s worth of reminders, all due at once
+    for telegram_id in range(int(20 / DISPATCH_SECONDS)):
+        ready(FakeMessenger(telegram_id, Lane.reminder))
+
+    # Well into the burst, the reminder head is past the starvation threshold
+    while clock.now < MessengerQueue.STARVATION_SECONDS * 2:
+        assert next_messenger().lane is Lane.reminder
+        clock.now += DISPATCH_SECONDS
+
+    tap = FakeMessenger(-1, Lane.interactive)
+    tapped_at = clock.now
+    ready(tap)
+    while next_messenger() is not tap:
+        clock.now += DISPATCH_SECONDS
+
+    assert clock.now - tapped_at <= 2 * DISPATCH_SECONDS
+
+
+def test_lanes_keep_their_share_under_sustained_load(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(messenger_queue, 'time', clock)
+    queue = MessengerQueue()
+    ready = queue._MessengerQueue__on_messenger_ready
+    next_messenger = queue._MessengerQueue__next_messenger
+
+    telegram_ids = iter(range(10 ** 6))
+    for lane in Lane:
+        for _ in range(100):
+            ready(FakeMessenger(next(telegram_ids), lane))
+
+    rounds = 60
+    served = {lane: 0 for lane in Lane}
+    # Long enough for every head to be past the starvation threshold
+    for _ in range(sum(MessengerQueue.LANE_WEIGHTS.values()) * rounds):
+        messenger = next_messenger()
+        served[messenger.lane] += 1
+        # Keep every lane busy
+        ready(FakeMessenger(next(telegram_ids), messenger.lane))
+        clock.now += DISPATCH_SECONDS
+
+    assert clock.now > MessengerQueue.STARVATION_SECONDS * 2
+    assert served == {lane: weight * rounds for lane, weight in MessengerQueue.LANE_WEIGHTS.items()}
+
+
+def test_starving_lane_is_rescued_when_dispatch_is_slow(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(messenger_queue, 'time', clock)
+    queue = MessengerQueue()
+    ready = queue._MessengerQueue__on_messenger_ready
+    next_messenger = queue._MessengerQueue__next_messenger
+
+    telegram_ids = iter(range(10 ** 6))
+    for lane in Lane:
+        for _ in range(100):
+            ready(FakeMessenger(next(telegram_ids), lane))
+
+    # One dispatch a second: by weight alone background would wait 10 s between turns
+    served_at = []
+    for _ in range(100):
+        messenger = next_messenger()
+        if messenger.lane is Lane.background:
+            served_at.append(clock.now)
+        ready(FakeMessenger(next(telegram_ids), messenger.lane))
+        clock.now += 1.0
+
+    gaps = [b - a for a, b in zip(served_at, served_at[1:])]
+    assert max(gaps) <= MessengerQueue.STARVATION_SECONDS + 1.0
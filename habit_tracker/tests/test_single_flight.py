@@ -0,0 +1,48 @@
+import asyncio
+import os
+
+os.environ.setdefault('API_ENDPOINT_PORT', '39999')
+
+from core.single_flight import SingleFlight
+
+
+def test_caller_after_last_waiter_cancelled_starts_new_call():
+    async def main():
+        flight = SingleFlight('test_cancelled')
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return calls
+
+        first = asyncio.create_task(flight.do('key', fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        # Let the cancelled waiter unwind, the shared task is cancelled but not finished yet
+        await asyncio.sleep(0)
+        assert first.cancelled()
+
+        assert await flight.do('key', fetch) == 2
+        assert flight.in_flight() == 0
+
+    asyncio.run(main())
+
+
+def test_concurrent_callers_share_one_call():
+    async def main():
+        flight = SingleFlight('test_shared')
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return calls
+
+        results = await asyncio.gather(*(flight.do('key', fetch) for _ in range(5)))
+        assert results == [1] * 5
+        assert flight.coalesced == 4
+
+    asyncio.run(main())
@@ -1,7 +1,8 @@
 from fastapi import Header
 from fastapi import APIRouter
 
-from bot import bot_instance
+from bot.messenger import Lane
+from bot.messenger_queue import MessengerQueue
 from data.schemas.send_message import SendMessageRequest
 
 
@@ -10,4 +11,6 @@ router = APIRouter()
 
 @router.post("/send-message/")
 async def send_message(req: SendMessageRequest, x_secret: str = Header(None)):
-    await bot_instance.send_message(req.user_id, req.message)
+    messenger = MessengerQueue.instance.get_messenger(req.user_id)
+    # Admin messages stay in the chat, they are not cleaned up with the temp messages
+    await messenger.enqueue_message(req.message, lane=Lane.background, track=False)
@@ -3,11 +3,13 @@ import uvicorn
 
 from config import API_ENDPOINT_PORT
 
-from .handlers.send_message import router
+from .handlers.send_message import router as send_message_router
+from .handlers.metrics import router as metrics_router
 
 
 app = FastAPI()
-app.include_router(router)
+app.include_router(send_message_router)
+app.include_router(metrics_router)
 
 
 async def run_http():